@@ -13,12 +13,14 @@ setup(
             'bs4',
             'datetime',
             'dateutil',
+            'lxml',
             'dash',
             'dash_bootstrap_components',
             'dash_core_components',
             'dash_html_components',
             'pandas',
             'plotly',
+            'pyarrow',
             're',
             'requests',
             'selenium'
@@ -0,0 +1,82 @@
+"""
+Class definition for benchmark harness.
+"""
+import json
+import numpy as np
+import time
+import tracemalloc
+
+
+class Benchmark:
+    """Timing harness reporting latency percentiles, throughput and peak memory"""
+    percentiles = [50, 95, 99]
+
+    def __init__(self, repeat=5, tolerance=0.2):
+        self.repeat = repeat
+        self.tolerance = tolerance
+        self.results = dict()
+
+    def run(self, name, fn, items=1, setup=None):
+        """Time fn over repeat runs; items is the unit count used for throughput.
+
+        Peak memory is measured in one extra traced run ahead of the timed ones.
+        """
+        # the traced run doubles as warm-up, tracing overhead stays out of the latencies
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        fn()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        latencies = list()
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - start)
+
+        latencies = np.array(latencies)
+        result = {'p{}'.format(p): float(np.percentile(latencies, p)) for p in self.percentiles}
+        result['throughput'] = items / float(np.median(latencies))
+        result['peak_memory'] = int(peak_memory)
+        self.results[name] = result
+
+        return result
+
+    def report(self, baseline=None):
+        lines = ['{:<50} {:>10} {:>10} {:>10} {:>14} {:>12} {:>9}'.format(
+            'benchmark', 'p50 [ms]', 'p95 [ms]', 'p99 [ms]', 'items/s', 'peak [MiB]', 'vs base'
+        )]
+        for name, result in self.results.items():
+            change = ''
+            if baseline is not None and name in baseline:
+                change = '{:+.0%}'.format(result['p50'] / baseline[name]['p50'] - 1)
+            lines.append('{:<50} {:>10.2f} {:>10.2f} {:>10.2f} {:>14.1f} {:>12.2f} {:>9}'.format(
+                name,
+                result['p50'] * 1000,
+                result['p95'] * 1000,
+                result['p99'] * 1000,
+                result['throughput'],
+                result['peak_memory'] / 2**20,
+                change
+            ))
+
+        return '\n'.join(lines)
+
+    def regressions(self, baseline):
+        """Return the benchmarks whose median latency exceeds the baseline by more than tolerance."""
+        return [
+            name for name, result in self.results.items()
+            if name in baseline and result['p50'] > baseline[name]['p50'] * (1 + self.tolerance)
+        ]
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.results, f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def load(path):
+        with open(path) as f:
+            return json.load(f)
@@ -0,0 +1,75 @@
+"""
+Class definition for static ING page fixtures.
+"""
+import numpy as np
+import zlib
+
+
+class IngFixtures:
+    """Static wertpapiere.ing.de pages in the markup the scraper parses
+
+    The pages carry the same classes and data attributes as the live site, so
+    they exercise the real extraction code. They can be written into a
+    PageCache and replayed by an offline IngDataScraper.
+    """
+    index_components_url = 'https://wertpapiere.ing.de/Investieren/Index/EnthalteneWerte/'
+    stock_profile_url = 'https://wertpapiere.ing.de/Investieren/Aktie/Firmenprofil/'
+
+    __pnl_fields = ['turnover', 'resultOfOperations', 'incomeAfterTax']
+    __balance_fields = ['labelCurrentAssets', 'labelCapitalAssets', 'labelEquity', 'labelTotalLiabilities']
+
+    def __init__(self, years=range(2012, 2020)):
+        self.years = list(years)
+
+    @staticmethod
+    def isins(n_components, prefix='XX'):
+        return ['{prefix}{number:010d}'.format(prefix=prefix, number=i) for i in range(n_components)]
+
+    @staticmethod
+    def __number(value):
+        # German number format as shown on the site, e.g. 1.234,56
+        return '{:,.2f}'.format(value).replace(',', '_').replace('.', ',').replace('_', '.')
+
+    def __table(self, class_name, fields, rng):
+        header = ''.join(
+            '<td data-position="{i}">{year}</td>'.format(i=i, year=year) for i, year in enumerate(self.years)
+        )
+        rows = ''.join(
+            '<tr data-row="{field}"><th>{field}</th>{cells}</tr>'.format(
+                field=field,
+                cells=''.join('<td>{}</td>'.format(self.__number(v)) for v in rng.uniform(100, 50000, len(self.years)))
+            )
+            for field in fields
+        )
+        return '<div class="{cls}"><table><thead><tr><td></td>{header}</tr></thead><tbody>{rows}</tbody></table></div>'.format(
+            cls=class_name, header=header, rows=rows
+        )
+
+    def components_page(self, isins):
+        anchors = ''.join(
+            '<tr><td><a href="/Investieren/Aktie/{isin}">Company {isin}</a></td></tr>'.format(isin=isin)
+            for isin in isins
+        )
+        return '<html><body><div class="sh-index-contained-shares-list"><table>{anchors}</table></div>' \
+            '<span class="last"></span></body></html>'.format(anchors=anchors)
+
+    def profile_page(self, isin):
+        rng = np.random.default_rng(zlib.crc32(isin.encode()))
+        market_cap = '{} Mio. EUR'.format(self.__number(rng.uniform(1000, 200000)).split(',')[0])
+
+        return '<html><body>{pnl}{balance}<div class="sh-facts-list"><table>' \
+            '<tr><td class="sh-table-cell-value">Börsenwert</td><td>{cap}</td></tr>' \
+            '</table></div><span class="row-change"></span></body></html>'.format(
+                pnl=self.__table('sh-share-income-statement', self.__pnl_fields, rng),
+                balance=self.__table('sh-balance-sheet', self.__balance_fields, rng),
+                cap=market_cap
+            )
+
+    def populate(self, cache, index_isin, n_components):
+        """Write an index page and the profile pages of its components into cache."""
+        isins = self.isins(n_components)
+        cache.put(self.index_components_url + index_isin, self.components_page(isins))
+        for isin in isins:
+            cache.put(self.stock_profile_url + isin, self.profile_page(isin))
+
+        return isins
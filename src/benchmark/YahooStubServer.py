@@ -0,0 +1,129 @@
+"""
+Class definition for local Yahoo stand-in server.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import datetime as dt
+import numpy as np
+import os
+import pandas as pd
+import threading
+from urllib.parse import parse_qs, unquote, urlparse
+import zlib
+
+
+class YahooStubServer:
+    """Local HTTP server replaying Yahoo crumb pages and CSV downloads
+
+    Recorded responses are read from `<fixtures>/<ticker>.csv` (daily bars in
+    Yahoo's download format). Tickers without a recording get a deterministic
+    synthetic random walk, so any universe size can be benchmarked offline.
+    """
+    crumb = 'benchmarkCrumb'
+    __history_start = dt.datetime(1985, 1, 1)
+    __history_end = dt.datetime(2021, 1, 1)
+
+    def __init__(self, fixtures_path=None, port=0):
+        self.fixtures_path = fixtures_path
+        self.__histories = dict()
+        self.__responses = dict()
+        self.__lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.__handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{port}'.format(port=self.server.server_address[1])
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def history(self, ticker):
+        with self.__lock:
+            if ticker not in self.__histories:
+                self.__histories[ticker] = self.__load_history(ticker)
+            return self.__histories[ticker]
+
+    def __load_history(self, ticker):
+        if self.fixtures_path is not None:
+            path = os.path.join(self.fixtures_path, ticker + '.csv')
+            if os.path.exists(path):
+                return pd.read_csv(path, index_col='Date', parse_dates=['Date'])
+
+        dates = pd.bdate_range(self.__history_start, self.__history_end, name='Date')
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+        spread = close * rng.uniform(0, 0.01, len(dates))
+
+        return pd.DataFrame(
+            {
+                'Open': close + rng.normal(0, 1, len(dates)) * spread,
+                'High': close + spread,
+                'Low': close - spread,
+                'Close': close,
+                'Adj Close': close,
+                'Volume': rng.integers(10**5, 10**7, len(dates))
+            },
+            index=dates
+        )
+
+    @staticmethod
+    def from_seconds(seconds):
+        return dt.datetime(1970, 1, 1) + dt.timedelta(seconds=int(seconds))
+
+    def csv(self, ticker, start, end):
+        # responses are rendered once, so repeated runs time the client rather than the stub
+        key = (ticker, start, end)
+        if key not in self.__responses:
+            history = self.history(ticker)
+            self.__responses[key] = history.loc[start:end].to_csv(float_format='%.6f').encode()
+
+        return self.__responses[key]
+
+    def __handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def __send(self, body, content_type, headers=()):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for header in headers:
+                    self.send_header(*header)
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except ConnectionError:
+                    # the client timed out and will retry on a fresh connection
+                    self.close_connection = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = url.path.strip('/').split('/')
+
+                if parts[0] == 'quote':
+                    body = '<script>"CrumbStore":{{"crumb":"{crumb}"}}</script>'.format(crumb=stub.crumb)
+                    self.__send(body.encode(), 'text/html', [('Set-Cookie', 'B=benchmark; Path=/')])
+                elif parts[:3] == ['v7', 'finance', 'download']:
+                    query = parse_qs(url.query)
+                    if query.get('crumb') != [stub.crumb]:
+                        self.send_error(401)
+                        return
+                    start = stub.from_seconds(query['period1'][0])
+                    end = stub.from_seconds(query['period2'][0])
+                    self.__send(stub.csv(unquote(parts[3]), start, end), 'text/csv')
+                else:
+                    self.send_error(404)
+
+        return Handler
@@ -0,0 +1,199 @@
+"""
+Offline benchmark suite for the data pipeline and the dashboard.
+
+Yahoo is replaced by a local HTTP server and ING by static pages replayed from
+an offline page cache, so the suite runs without network access. Run from the
+repository root:
+
+    python -m src.benchmark.run_benchmarks --baseline benchmark_baseline.json
+"""
+import argparse
+import datetime as dt
+import os
+import plotly.io
+import sys
+import tempfile
+
+from src.benchmark.Benchmark import Benchmark
+from src.benchmark.IngFixtures import IngFixtures
+from src.benchmark.YahooStubServer import YahooStubServer
+from src.data.IngDataScraper import IngDataScraper
+from src.data.IngStockProfile import IngStockProfile
+from src.data.PageCache import PageCache
+from src.data.PricePanel import PricePanel
+from src.data.QuoteStore import QuoteStore
+from src.data.YahooDataLoader import YahooDataLoader
+from src.finance.analytics.IndexBacktest import IndexBacktest
+from src.finance.analytics.RollingAnalytics import RollingAnalytics
+from src.finance.components.StockMarketIndex import StockMarketIndex
+
+end = dt.datetime(2020, 12, 31)
+index_isin = 'XX9999999999'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 10, 30])
+    parser.add_argument('--tickers', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--components', type=int, nargs='+', default=[30, 100])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--fixtures', help='directory with recorded Yahoo CSV responses')
+    parser.add_argument('--baseline', help='baseline results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown against the baseline')
+    return parser.parse_args()
+
+
+def tickers(n):
+    return ['BENCH{i}'.format(i=i) for i in range(n)]
+
+
+def bench_yahoo(benchmark, stub, args, work_dir):
+    loader = YahooDataLoader(host=stub.url, download_host=stub.url)
+
+    for years in args.years:
+        start = end - dt.timedelta(days=365 * years)
+        rows = len(stub.history('BENCH0').loc[start:end])
+        benchmark.run(
+            'yahoo.fetch[years={}]'.format(years),
+            lambda: loader.fetch('BENCH0', start, end, '1d'),
+            items=rows
+        )
+
+        for n in args.tickers:
+            benchmark.run(
+                'yahoo.fetch_many[tickers={},years={}]'.format(n, years),
+                lambda: loader.fetch_many(tickers(n), start, end, '1d'),
+                items=n
+            )
+
+        store_loader = YahooDataLoader(
+            store=QuoteStore(os.path.join(work_dir, 'quotes')),
+            host=stub.url,
+            download_host=stub.url
+        )
+        store_loader.fetch('BENCH0', start, end, '1d')
+        benchmark.run(
+            'yahoo.fetch_stored[years={}]'.format(years),
+            lambda: store_loader.fetch('BENCH0', start, end, '1d'),
+            items=rows
+        )
+
+    loader.close()
+
+
+def bench_ing(benchmark, args, work_dir):
+    fixtures = IngFixtures()
+    page = fixtures.profile_page(fixtures.isins(1)[0])
+
+    def extract():
+        profile = IngStockProfile('XX0000000000', page)
+        profile.pnl()
+        profile.balance()
+        profile.market_cap()
+
+    benchmark.run('ing.profile_extraction', extract)
+
+    for n in args.components:
+        cache_path = os.path.join(work_dir, 'pages_{n}'.format(n=n))
+        fixtures.populate(PageCache(cache_path), index_isin, n)
+        scraper = IngDataScraper(cache=PageCache(cache_path, offline=True))
+
+        def assemble():
+            index = StockMarketIndex(index_isin, 'BENCH0', ing_scraper=scraper)
+            index.fundamentals().summary()
+
+        benchmark.run('index.assembly[components={}]'.format(n), assemble, items=n)
+
+
+def bench_figures(benchmark, stub, args):
+    # the dashboard creates its stores relative to the working directory
+    from src.gui import app
+
+    for years in args.years:
+        start = end - dt.timedelta(days=365 * years)
+        for n in args.tickers:
+            figure_key = {
+                'index_tickers': tickers(n),
+                'commodity_tickers': [],
+                'start': start.strftime('%Y-%m-%d'),
+                'end': end.strftime('%Y-%m-%d'),
+                'freq': '1d'
+            }
+            ticker_data = {ticker: stub.history(ticker).loc[start:end] for ticker in tickers(n)}
+
+            benchmark.run(
+                'render_plots.figures[tickers={},years={}]'.format(n, years),
+                lambda: [
+                    plotly.io.to_json(figure)
+                    for figure in app.build_figures(figure_key, PricePanel.from_frames(ticker_data))
+                ],
+                items=n
+            )
+
+
+def bench_analytics(benchmark, stub, args):
+    def analyse(ticker_data):
+        analytics = RollingAnalytics(ticker_data)
+        analytics.moving_average(200)
+        analytics.volatility(21)
+        analytics.drawdown()
+        analytics.correlation(63)
+
+    for years in args.years:
+        start = end - dt.timedelta(days=365 * years)
+        for n in args.tickers:
+            ticker_data = {ticker: stub.history(ticker).loc[start:end] for ticker in tickers(n)}
+            benchmark.run(
+                'analytics.rolling[tickers={},years={}]'.format(n, years),
+                lambda: analyse(ticker_data),
+                items=n
+            )
+
+
+def bench_backtest(benchmark, stub, args):
+    for years in args.years:
+        start = end - dt.timedelta(days=365 * years)
+        for n in args.components:
+            prices = {ticker: stub.history(ticker).loc[start:end] for ticker in tickers(n)}
+            market_caps = {ticker: float(i + 1) for i, ticker in enumerate(tickers(n))}
+            index_levels = IndexBacktest(prices, market_caps).run('cap', None)[0]
+
+            # every scheme under every rebalancing frequency, as the dashboard runs them
+            benchmark.run(
+                'backtest.grid[components={},years={}]'.format(n, years),
+                lambda: IndexBacktest(prices, market_caps).grid(benchmark=index_levels),
+                items=n
+            )
+
+
+def main():
+    args = parse_args()
+    benchmark = Benchmark(repeat=args.repeat, tolerance=args.tolerance)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    with tempfile.TemporaryDirectory() as work_dir, YahooStubServer(args.fixtures) as stub:
+        os.chdir(work_dir)
+        bench_yahoo(benchmark, stub, args, work_dir)
+        bench_ing(benchmark, args, work_dir)
+        bench_figures(benchmark, stub, args)
+        bench_analytics(benchmark, stub, args)
+        bench_backtest(benchmark, stub, args)
+
+    baseline = None
+    if baseline_path is not None and os.path.exists(baseline_path):
+        baseline = Benchmark.load(baseline_path)
+
+    print(benchmark.report(baseline))
+
+    if args.save_baseline and baseline_path is not None:
+        benchmark.save(baseline_path)
+    elif baseline is not None:
+        regressions = benchmark.regressions(baseline)
+        if regressions:
+            print('\nRegressions beyond {:.0%}:'.format(args.tolerance), *regressions, sep='\n')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
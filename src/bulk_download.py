@@ -0,0 +1,59 @@
+"""
+Bulk download of price histories and index fundamentals for a whole universe.
+
+The universe is a CSV file with the columns `type` and `symbol`, e.g.
+
+    type,symbol
+    ticker,%5EGDAXI
+    ticker,SAP.DE
+    index,DE0008469008
+
+Tickers get their price history from Yahoo; indices get their component list
+and the fundamentals of every component from ING. Progress is checkpointed, so
+rerunning the same command after an interruption resumes the download.
+"""
+import argparse
+import datetime as dt
+import sys
+
+from src.data.BulkDownloader import BulkDownloader
+from src.data.SqliteCacheBackend import SqliteCacheBackend
+
+
+def parse_date(value):
+    return dt.datetime.strptime(value, '%Y-%m-%d')
+
+
+parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+parser.add_argument('universe', help='CSV file with the columns type (ticker or index) and symbol')
+parser.add_argument('--output', default='data/bulk', help='directory for quotes, fundamentals and the checkpoint')
+parser.add_argument('--start', type=parse_date, default=dt.datetime(2000, 1, 1))
+parser.add_argument('--end', type=parse_date, default=dt.datetime.combine(dt.date.today(), dt.time()))
+parser.add_argument('--freq', default='1d', choices=['1d', '1wk', '1mo'])
+parser.add_argument('--workers', type=int, default=8, help='number of concurrent downloads')
+parser.add_argument(
+    '--rate',
+    type=float,
+    default=5.,
+    help='requests per second across all workers; ING pages never exceed their own limit of 2/s'
+)
+parser.add_argument('--cache', default='data/cache.sqlite', help='response cache shared with the dashboard')
+parser.add_argument('--no-cache', action='store_true', help='download everything regardless of the cache')
+args = parser.parse_args()
+
+tickers, index_isins = BulkDownloader.read_universe(args.universe)
+
+with BulkDownloader(
+    output_path=args.output,
+    start=args.start,
+    end=args.end,
+    freq=args.freq,
+    workers=args.workers,
+    rate=args.rate,
+    cache_backend=None if args.no_cache else SqliteCacheBackend(args.cache)
+) as downloader:
+    failed = downloader.run(tickers, index_isins)
+
+if failed:
+    print('{n} tasks failed, rerun to retry them'.format(n=len(failed)), file=sys.stderr)
+    sys.exit(1)
@@ -0,0 +1,189 @@
+"""
+Class definition for resumable bulk downloader.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import csv
+import datetime as dt
+import json
+import os
+import sys
+import threading
+
+from src.data.FundamentalsStore import FundamentalsStore
+from src.data.PageCache import PageCache
+from src.data.QuoteStore import QuoteStore
+from src.data.RateLimiter import RateLimiter
+from src.data.RequestCoordinator import request_coordinator, yahoo_hosts
+from src.data.YahooDataLoader import YahooDataLoader
+
+
+class BulkDownloader:
+    """Resumable bulk download of price histories and index fundamentals
+
+    Every finished task is appended to a checkpoint log right after its result
+    has been written, so an interrupted run picks up where it stopped.
+    """
+    __universe_types = ('ticker', 'index')
+
+    def __init__(self, output_path, start, end, freq='1d', workers=8, rate=5., checkpoint_path=None,
+                 yahoo_loader=None, ing_scraper=None, cache_backend=None, coordinator=None):
+        """
+        :param rate: task starts per second across all workers, which also replaces the Yahoo request
+            limit of the shared request layer
+        :param coordinator: RequestCoordinator of the loaders created here, overriding rate for Yahoo
+        """
+        self.output_path = output_path
+        self.start = start
+        self.end = end
+        self.freq = freq
+        self.workers = workers
+        self.rate_limiter = RateLimiter(rate, burst=workers)
+        # the shared request layer would otherwise cap Yahoo at its default rate whatever rate is given
+        self.coordinator = coordinator or request_coordinator.with_rates(dict.fromkeys(yahoo_hosts, rate))
+        self.checkpoint_path = checkpoint_path or os.path.join(output_path, 'checkpoint.jsonl')
+
+        os.makedirs(os.path.join(output_path, 'components'), exist_ok=True)
+        self.fundamentals_store = FundamentalsStore(os.path.join(output_path, 'fundamentals'))
+        # responses other processes on the host already fetched are served from it
+        self.cache_backend = cache_backend
+
+        self.yahoo_loader = yahoo_loader or YahooDataLoader(
+            store=QuoteStore(os.path.join(output_path, 'quotes')),
+            max_workers=workers,
+            cache=cache_backend,
+            coordinator=self.coordinator
+        )
+        self.__ing_scraper = ing_scraper
+
+        self.__done = self.__load_checkpoint()
+        self.__checkpoint_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def ing_scraper(self):
+        if self.__ing_scraper is None:
+            from src.data.IngDataScraper import IngDataScraper
+            self.__ing_scraper = IngDataScraper(
+                pool_size=min(self.workers, 4),
+                coordinator=self.coordinator,
+                cache=None if self.cache_backend is None else PageCache(backend=self.cache_backend)
+            )
+
+        return self.__ing_scraper
+
+    @classmethod
+    def read_universe(cls, path):
+        """Read a CSV universe file with the columns type (ticker or index) and symbol."""
+        universe = {universe_type: list() for universe_type in cls.__universe_types}
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                if row['type'] not in universe:
+                    raise ValueError('unknown universe type: {}'.format(row['type']))
+                universe[row['type']].append(row['symbol'].strip())
+
+        return universe['ticker'], universe['index']
+
+    def __load_checkpoint(self):
+        done = set()
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                for line in f:
+                    # a line cut short by a crash is simply redone
+                    try:
+                        done.add(json.loads(line)['task'])
+                    except ValueError:
+                        pass
+
+        return done
+
+    def __mark_done(self, task):
+        with self.__checkpoint_lock:
+            with open(self.checkpoint_path, 'a') as f:
+                f.write(json.dumps({'task': task, 'time': dt.datetime.now().isoformat()}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.__done.add(task)
+
+    def __write_json(self, path, obj):
+        with open(path + '.tmp', 'w') as f:
+            json.dump(obj, f)
+        os.replace(path + '.tmp', path)
+
+    def __components_path(self, isin):
+        return os.path.join(self.output_path, 'components', isin + '.json')
+
+    def __download_prices(self, ticker):
+        self.rate_limiter.acquire()
+        self.yahoo_loader.fetch(ticker, self.start, self.end, self.freq)
+
+        return []
+
+    def __download_components(self, isin):
+        path = self.__components_path(isin)
+        if 'components:' + isin not in self.__done:
+            self.rate_limiter.acquire()
+            components = self.ing_scraper.get_components(isin)
+            if components is None:
+                raise RuntimeError('no components page for {}'.format(isin))
+            self.__write_json(path, {cisin: details[0] for cisin, details in components.items()})
+
+        with open(path) as f:
+            return list(json.load(f))
+
+    def __download_fundamentals(self, isin):
+        self.rate_limiter.acquire()
+        profile = self.ing_scraper.get_profile(isin)
+        if profile is None:
+            raise RuntimeError('no profile page for {}'.format(isin))
+
+        self.fundamentals_store.put_profiles([profile])
+
+        return []
+
+    def run(self, tickers, index_isins):
+        """Download everything not yet in the checkpoint; returns a dict of failed tasks."""
+        tasks = {'prices:' + ticker: (self.__download_prices, ticker) for ticker in tickers}
+        tasks.update({'components:' + isin: (self.__download_components, isin) for isin in index_isins})
+
+        scheduled = set()
+        failed = dict()
+        pending = dict()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            def _schedule(new_tasks):
+                for task, (fn, arg) in new_tasks.items():
+                    # component lists are always re-read, so their fundamentals get scheduled
+                    if task in scheduled or (task in self.__done and not task.startswith('components:')):
+                        continue
+                    scheduled.add(task)
+                    pending[executor.submit(fn, arg)] = task
+
+            _schedule(tasks)
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = pending.pop(future)
+                    try:
+                        follow_ups = future.result()
+                    except Exception as error:
+                        failed[task] = error
+                        print('failed {task}: {error}'.format(task=task, error=error), file=sys.stderr)
+                        continue
+
+                    if task not in self.__done:
+                        self.__mark_done(task)
+                    _schedule({
+                        'fundamentals:' + cisin: (self.__download_fundamentals, cisin) for cisin in follow_ups
+                    })
+
+        return failed
+
+    def close(self):
+        self.yahoo_loader.close()
+        if self.__ing_scraper is not None:
+            self.__ing_scraper.close()
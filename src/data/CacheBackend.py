@@ -0,0 +1,42 @@
+"""
+Class definition for cache backend interface.
+"""
+from abc import ABC, abstractmethod
+
+
+class CacheBackend(ABC):
+    """Byte cache shared by the loaders of all processes on a host
+
+    Entries are keyed by (namespace, key). A ttl given on put bounds how long
+    an entry may be served at all; max_age on get lets each reader apply its
+    own freshness, e.g. PageCache ignores it when replaying offline.
+    Implementations must make writes atomic, so a reader in any process sees
+    either the old or the new value of an entry, never a partial one.
+    """
+
+    @abstractmethod
+    def get(self, namespace, key, max_age=None):
+        """Return the cached bytes, or None if the entry is missing, expired or older than max_age."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def put(self, namespace, key, value, ttl=None):
+        """Store value, replacing any previous entry; without a ttl it lives until evicted."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, namespace, key):
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self, namespace=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,187 @@
+"""
+Class definition for incremental end-of-day updater.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import csv
+import datetime as dt
+import json
+import numpy as np
+import os
+import sys
+import time
+
+from src.monitoring.Metrics import metrics
+
+
+class EndOfDayUpdater:
+    """Incremental end-of-day update of index benchmarks and their components
+
+    Every ticker is only asked for the bars since its last stored date, plus a
+    short overlap. When Yahoo reports different closes for the overlapping
+    days, it has revised the history (a split or a dividend rescales all
+    adjusted closes), so the ticker's history is dropped and downloaded again.
+    Component lists are compared against the previous run and changes are
+    appended to a log.
+    """
+    __freq = '1d'
+    __compared_columns = ['Close', 'Adj Close']
+    __components_dir = 'components'
+    __changes_file = 'component_changes.jsonl'
+
+    def __init__(self, indices, yahoo_loader, ticker_map=None, tickers=(), state_path='data/eod',
+                 history_start=dt.datetime(2000, 1, 1), overlap=dt.timedelta(days=7), rtol=1e-5):
+        """
+        :param indices: StockMarketIndex objects, whose yahoo tickers are updated as benchmarks
+        :param yahoo_loader: loader backed by the QuoteStore that is kept up to date
+        :param ticker_map: dict of component ISIN -> Yahoo ticker, components without one are skipped
+        :param tickers: further Yahoo tickers to update
+        """
+        if yahoo_loader.store is None:
+            raise ValueError('the yahoo loader needs a quote store to update')
+
+        self.indices = list(indices)
+        self.yahoo_loader = yahoo_loader
+        self.store = yahoo_loader.store
+        self.ticker_map = ticker_map or dict()
+        self.tickers = list(tickers)
+        self.state_path = state_path
+        self.history_start = history_start
+        self.overlap = overlap
+        self.rtol = rtol
+
+        os.makedirs(os.path.join(self.state_path, self.__components_dir), exist_ok=True)
+
+    @staticmethod
+    def read_ticker_map(path):
+        """Read a CSV file with the columns isin and ticker."""
+        with open(path, newline='') as f:
+            return {row['isin'].strip(): row['ticker'].strip() for row in csv.DictReader(f)}
+
+    def __components_path(self, isin):
+        return os.path.join(self.state_path, self.__components_dir, isin + '.json')
+
+    def update_components(self, index):
+        """Reload the component list of index and return the (added, removed) ISINs since the last run."""
+        components = index.components(refresh=True)
+        path = self.__components_path(index.isin)
+        try:
+            with open(path) as f:
+                previous = json.load(f)
+        except FileNotFoundError:
+            previous = None
+
+        added = sorted(set(components) - set(previous or components))
+        removed = sorted(set(previous or components) - set(components))
+        if added or removed:
+            metrics.inc('component_changes', len(added) + len(removed), index=index.isin)
+            with open(os.path.join(self.state_path, self.__changes_file), 'a') as f:
+                f.write(json.dumps({
+                    'date': dt.date.today().isoformat(),
+                    'index': index.isin,
+                    'added': {isin: components[isin] for isin in added},
+                    'removed': {isin: previous[isin] for isin in removed}
+                }) + '\n')
+
+        with open(path + '.tmp', 'w') as f:
+            json.dump(components, f)
+        os.replace(path + '.tmp', path)
+
+        return added, removed
+
+    def __revised(self, stored, fresh):
+        common = stored.index.intersection(fresh.index)
+        if not len(common):
+            # no overlapping bar to compare, e.g. after a long trading halt
+            return False
+
+        return not np.allclose(
+            stored.loc[common, self.__compared_columns].to_numpy(),
+            fresh.loc[common, self.__compared_columns].to_numpy(),
+            rtol=self.rtol,
+            equal_nan=True
+        )
+
+    def update_ticker(self, ticker, today=None):
+        """Bring the stored bars of ticker up to today; returns the status and the number of bars downloaded."""
+        today = today or dt.datetime.combine(dt.date.today(), dt.time())
+        # bars are downloaded up to the end of today, so a run after the close gets today's
+        # close; the store still only marks the days before today as covered
+        until = today + dt.timedelta(days=1)
+        covered = self.store.coverage(ticker, self.__freq)
+
+        if covered is None:
+            data = self.yahoo_loader.fetch(ticker, self.history_start, until, self.__freq)
+            return 'new', len(data)
+
+        start, end = covered
+        if end >= until:
+            return 'current', 0
+
+        window_start = end - self.overlap
+        fresh = self.yahoo_loader.download(ticker, window_start, until, self.__freq)
+        if self.__revised(self.store.read(ticker, self.__freq, window_start, end), fresh):
+            metrics.inc('eod_revisions')
+            self.store.drop(ticker, self.__freq)
+            data = self.yahoo_loader.fetch(ticker, start, until, self.__freq)
+            return 'revised', len(fresh) + len(data)
+
+        self.store.merge(ticker, self.__freq, window_start, until, fresh)
+        return 'updated', len(fresh)
+
+    def run(self):
+        """Run one update and return a report of the component changes and of every ticker's outcome."""
+        report = {'components': dict(), 'tickers': dict(), 'unmapped': list(), 'errors': dict()}
+
+        tickers = dict.fromkeys(self.tickers)
+        for index in self.indices:
+            tickers[index.yahoo_ticker] = None
+            try:
+                report['components'][index.isin] = self.update_components(index)
+                components = index.components()
+            except Exception as error:
+                report['errors'][index.isin] = error
+                continue
+
+            for isin in components:
+                if isin in self.ticker_map:
+                    tickers[self.ticker_map[isin]] = None
+                else:
+                    report['unmapped'].append(isin)
+
+        with metrics.timer('stage', stage='eod_update'), \
+                ThreadPoolExecutor(max_workers=self.yahoo_loader.max_workers) as executor:
+            futures = {
+                ticker: executor.submit(contextvars.copy_context().run, self.update_ticker, ticker)
+                for ticker in tickers
+            }
+            for ticker, future in futures.items():
+                try:
+                    report['tickers'][ticker] = future.result()
+                except Exception as error:
+                    report['errors'][ticker] = error
+
+        return report
+
+    @staticmethod
+    def next_run(at, now=None):
+        """Return the next weekday at time `at`, after the markets have closed."""
+        now = now or dt.datetime.now()
+        run = dt.datetime.combine(now.date(), at)
+        if run <= now:
+            run += dt.timedelta(days=1)
+        while run.weekday() >= 5:
+            run += dt.timedelta(days=1)
+
+        return run
+
+    def run_forever(self, at=dt.time(23, 0), on_report=None):
+        """Run an update every weekday at time `at` until interrupted."""
+        while True:
+            run = self.next_run(at)
+            print('next update at {run}'.format(run=run.isoformat(sep=' ')), file=sys.stderr)
+            time.sleep(max(0., (run - dt.datetime.now()).total_seconds()))
+
+            report = self.run()
+            if on_report is not None:
+                on_report(report)
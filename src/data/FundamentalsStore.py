@@ -0,0 +1,209 @@
+"""
+Class definition for fundamentals store.
+"""
+from contextlib import contextmanager
+import datetime as dt
+import fcntl
+import numpy as np
+import os
+import pandas as pd
+import threading
+import time
+import uuid
+
+from src.monitoring.Metrics import metrics
+
+
+class FundamentalsStore:
+    """Parquet-backed columnar store of scraped company financials
+
+    Rows are keyed by (isin, year, scrape_date) and carry the P&L and balance
+    sheet fields of that year plus the market cap on the scrape date. Every
+    write adds a small segment file, which keeps concurrent writers apart;
+    segments are compacted into the main file once there are enough of them.
+
+    Queries run against an in-memory table sorted by the key, which is
+    reloaded whenever the files on disk change, so lookups by ISIN and year
+    range are index slices rather than scans.
+    """
+    pnl_fields = ['turnover', 'ebit', 'income']
+    balance_fields = ['current_assets', 'capital_assets', 'equity', 'liabilities']
+    fields = pnl_fields + balance_fields + ['market_cap']
+    key = ['isin', 'year', 'scrape_date']
+
+    __main_file = 'fundamentals.parquet'
+    __segment_prefix = 'segment-'
+    __compact_lock_file = 'compact.lock'
+
+    def __init__(self, path='data/fundamentals', max_segments=64):
+        self.path = path
+        self.max_segments = max_segments
+        os.makedirs(self.path, exist_ok=True)
+
+        self.__files = None
+        self.__table = None
+        self.__latest = None
+        self.__lock = threading.Lock()
+
+    def __list_files(self):
+        names = sorted(
+            name for name in os.listdir(self.path)
+            if name.endswith('.parquet') and (name == self.__main_file or name.startswith(self.__segment_prefix))
+        )
+        return tuple((name, os.stat(os.path.join(self.path, name)).st_mtime_ns) for name in names)
+
+    def __read(self, files):
+        # the main file sorts before the segments, which are named in order of writing
+        frames = [pd.read_parquet(os.path.join(self.path, name)) for name, _ in files]
+        if not frames:
+            return self.__empty()
+
+        data = pd.concat(frames, ignore_index=True)
+        data = data.drop_duplicates(subset=self.key, keep='last')
+        return data.set_index(self.key).sort_index()
+
+    def __empty(self):
+        index = pd.MultiIndex.from_arrays(
+            [pd.Index([], dtype=object), pd.Index([], dtype='int64'), pd.DatetimeIndex([])],
+            names=self.key
+        )
+        return pd.DataFrame({field: pd.Series([], dtype='float64') for field in self.fields}, index=index)
+
+    def table(self):
+        """Return every stored row, indexed and sorted by (isin, year, scrape_date)."""
+        while True:
+            try:
+                files = self.__list_files()
+                with self.__lock:
+                    if files != self.__files:
+                        with metrics.timer('stage', stage='fundamentals_load'):
+                            table = self.__read(files)
+                        self.__files = files
+                        self.__table = table
+                        self.__latest = None
+                    return self.__table
+            except FileNotFoundError:
+                # a segment was compacted away between listing and reading
+                continue
+
+    def __latest_table(self, table):
+        with self.__lock:
+            if self.__latest is None or self.__latest[0] is not table:
+                latest = table[~table.index.droplevel('scrape_date').duplicated(keep='last')]
+                self.__latest = table, latest.reset_index('scrape_date')
+            return self.__latest[1]
+
+    def __write(self, frame):
+        name = '{prefix}{stamp:020d}-{id}.parquet'.format(
+            prefix=self.__segment_prefix,
+            stamp=time.time_ns(),
+            id=uuid.uuid4().hex[:8]
+        )
+        path = os.path.join(self.path, name)
+        frame.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+        metrics.inc('fundamentals_rows_written', len(frame))
+
+        if sum(name.startswith(self.__segment_prefix) for name, _ in self.__list_files()) > self.max_segments:
+            self.compact()
+
+    def __rows(self, isin, pnl, balance, market_cap, scrape_date):
+        rows = pnl.merge(balance, on='year', how='outer')
+        rows.insert(0, 'isin', isin)
+        rows['year'] = rows['year'].astype('int64')
+        rows['scrape_date'] = pd.Timestamp(scrape_date)
+        rows['market_cap'] = np.nan if market_cap is None else float(market_cap)
+
+        return rows[self.key + self.fields].astype({field: 'float64' for field in self.fields})
+
+    def put(self, isin, pnl, balance, market_cap, scrape_date=None):
+        """Store the statements of isin as scraped on scrape_date, today by default."""
+        self.__write(self.__rows(isin, pnl, balance, market_cap, scrape_date or dt.date.today()))
+
+    def put_profiles(self, profiles, scrape_date=None):
+        """Store several IngStockProfile objects in one segment."""
+        scrape_date = scrape_date or dt.date.today()
+        frames = [
+            self.__rows(profile.isin, profile.pnl(), profile.balance(), profile.market_cap(), scrape_date)
+            for profile in profiles
+        ]
+        if frames:
+            self.__write(pd.concat(frames, ignore_index=True))
+
+    @contextmanager
+    def __compact_lock(self):
+        with open(os.path.join(self.path, self.__compact_lock_file), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def compact(self):
+        """Merge all segments into the main file."""
+        with self.__compact_lock():
+            files = self.__list_files()
+            segments = [name for name, _ in files if name.startswith(self.__segment_prefix)]
+            if not segments:
+                return
+
+            path = os.path.join(self.path, self.__main_file)
+            self.__read(files).reset_index().to_parquet(path + '.tmp', index=False)
+            os.replace(path + '.tmp', path)
+            # readers listing files in between see rows twice, which the key deduplicates
+            for name in segments:
+                os.remove(os.path.join(self.path, name))
+
+    def query(self, isins=None, start_year=None, end_year=None, fields=None, as_of=None, history=False):
+        """Return the stored rows for isins and the years from start_year to end_year.
+
+        By default only the latest scrape of every (isin, year) is returned,
+        indexed by (isin, year) with the scrape_date as a column. With history
+        all scrapes are returned, indexed by (isin, year, scrape_date). as_of
+        leaves out scrapes after that date.
+        """
+        table = self.table()
+        if as_of is not None:
+            table = table[table.index.get_level_values('scrape_date') <= pd.Timestamp(as_of)]
+        if not history:
+            table = self.__latest_table(table) if as_of is None else \
+                table[~table.index.droplevel('scrape_date').duplicated(keep='last')].reset_index('scrape_date')
+
+        if isins is not None:
+            # levels keep the isins the filters above dropped, so the stored ones are taken from the values
+            stored = set(table.index.get_level_values('isin').unique())
+            isins = [isin for isin in dict.fromkeys(isins) if isin in stored]
+        selector = (slice(None) if isins is None else isins, slice(start_year, end_year))
+        with metrics.timer('stage', stage='fundamentals_query'):
+            result = table.loc[selector, :]
+
+        if fields is not None:
+            result = result[list(fields) + ([] if history else ['scrape_date'])]
+
+        return result
+
+    def matrix(self, field, isins=None, start_year=None, end_year=None, as_of=None):
+        """Return the latest values of field as an (isins x years) frame."""
+        return self.query(isins, start_year, end_year, [field], as_of)[field].unstack('year')
+
+    def financials(self, isins, since=None):
+        """Return the (pnl, balance) statements and market caps of the isins scraped since the given date.
+
+        The result has the shape IndexFundamentals expects; isins without a
+        recent enough scrape are left out.
+        """
+        latest = self.query(isins)
+        if since is not None:
+            latest = latest[latest['scrape_date'] >= pd.Timestamp(since)]
+
+        financials = dict()
+        market_caps = dict()
+        for isin, rows in latest.groupby(level='isin'):
+            # market caps of one scrape are the same for every year
+            rows = rows[rows['scrape_date'] == rows['scrape_date'].max()].reset_index('isin', drop=True)
+            rows = rows.reset_index()
+            financials[isin] = rows[['year'] + self.pnl_fields], rows[['year'] + self.balance_fields]
+            market_cap = rows['market_cap'].iloc[0]
+            market_caps[isin] = None if np.isnan(market_cap) else market_cap
+
+        return financials, market_caps
@@ -1,15 +1,16 @@
 """
 Class definition for ING data scraper.
 """
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import contextvars
+from functools import partial
+import queue
 import re
+import threading
+
+from src.data.RequestCoordinator import request_coordinator
+from src.monitoring.Metrics import metrics
 
 
 class IngDataScraper:
@@ -18,117 +19,184 @@ class IngDataScraper:
     __stock_profile_url = 'https://wertpapiere.ing.de/Investieren/Aktie/Firmenprofil/'
 
     __contained_shares_class = 'sh-index-contained-shares-list'
-    __pnl_class = 'sh-share-income-statement'
-    __balance_sheet_class = 'sh-balance-sheet'
-    __facts_class = 'sh-facts-list'
+    # only the facts table is waited for, as some profiles have no financial tables; pnl() and
+    # balance() raise for those
+    __profile_target_classes = ['sh-table-cell-value']
+
+    def __init__(self, max_delay=3, pool_size=4, cache=None, coordinator=None):
+        self.max_delay = max_delay
+        self.pool_size = pool_size
+        self.cache = cache
+        self.coordinator = coordinator or request_coordinator
 
-    __facts_key = 'Börsenwert'
+        self.__drivers = list()
+        self.__idle_drivers = queue.Queue()
+        self.__pool_lock = threading.Lock()
 
-    __pnl_fields = ['turnover', 'resultOfOperations', 'incomeAfterTax']
-    __balance_fields = ['labelCurrentAssets', 'labelCapitalAssets', 'labelEquity', 'labelTotalLiabilities']
+    def __enter__(self):
+        return self
 
-    __pnl_fields_vanity = ['turnover', 'ebit', 'income']
-    __balance_fields_vanity = ['current_assets', 'capital_assets', 'equity', 'liabilities']
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-    __MILLION = 10**6
+    def __start_driver(self):
+        # selenium is only imported once a browser is actually needed
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
 
-    def __init__(self, max_delay=3):
         chrome_options = Options()
         chrome_options.add_argument('--headless')
-        self.driver = webdriver.Chrome(options=chrome_options)
-        self.max_delay = max_delay
+        driver = webdriver.Chrome(options=chrome_options)
+        self.__drivers.append(driver)
+        return driver
+
+    @contextmanager
+    def __driver(self):
+        # reuse an idle driver, start a new one while the pool is not full,
+        # otherwise wait until another thread hands its driver back
+        try:
+            driver = self.__idle_drivers.get_nowait()
+        except queue.Empty:
+            with self.__pool_lock:
+                driver = self.__start_driver() if len(self.__drivers) < self.pool_size else None
+            if driver is None:
+                driver = self.__idle_drivers.get()
 
-    def __extract_table(self, soup, class_name, table_fields, vanity_names):
-        def to_float(string):
-            if string in (None, '', '-'):
-                return 0.
-            return float(string.replace('.', '').replace(',', '.'))
+        try:
+            yield driver
+        finally:
+            self.__idle_drivers.put(driver)
+
+    def __load_page(self, url, page_type, *target_classes, refresh=False):
+        # concurrent requests for the same page, e.g. P&L and market cap of one stock, share one navigation
+        key = ('ing', url, refresh)
+        return self.coordinator.singleflight(key, self.__load_page_once, url, page_type, target_classes, refresh)
+
+    def __load_page_once(self, url, page_type, target_classes, refresh):
+        if self.cache is not None:
+            if not refresh or self.cache.offline:
+                page_source = self.cache.get(url, page_type)
+                metrics.inc('cache_misses' if page_source is None else 'cache_hits', cache='ing_pages')
+                if page_source is not None or self.cache.offline:
+                    return page_source
+
+        page_source = self.coordinator.request(
+            url,
+            self.__navigate,
+            url,
+            page_type,
+            target_classes,
+            retryable=self.__is_transient
+        )
 
-        def floatable(string):
-            try:
-                to_float(string)
-            except ValueError:
-                return False
-            return True
+        if self.cache is not None and page_source is not None:
+            self.cache.put(url, page_source)
 
-        table = soup.find_all('div', {'class': class_name})
-        table_soup = BeautifulSoup(str(table), 'html.parser')
+        return page_source
 
-        result = pd.DataFrame(columns=['year'] + table_fields)
+    @staticmethod
+    def __is_transient(error):
+        from selenium.common.exceptions import WebDriverException
 
-        dates = [int(tag.text) for tag in table_soup.select('thead')[0].select('td[data-position]')]
-        result['year'] = dates
-        for field in table_fields:
-            rows = table_soup.find_all('tr', {'data-row': field})[0]
-            result[field] = [to_float(tag.text) * self.__MILLION for tag in rows if floatable(tag.text)]
-        result.columns = ['year'] + vanity_names
+        return isinstance(error, WebDriverException)
 
-        return result
+    def __navigate(self, url, page_type, target_classes):
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
 
-    def get_components(self, isin):
-        self.driver.get(self.__index_components_url + isin)
+        with self.__driver() as driver:
+            with metrics.timer('stage', stage='ing_navigate', page_type=page_type):
+                driver.get(url)
 
-        try:
-            target = EC.presence_of_element_located((By.CLASS_NAME, 'last'))
-            WebDriverWait(self.driver, self.max_delay).until(target)
-        except TimeoutException:
+            try:
+                target = EC.all_of(*[
+                    EC.presence_of_element_located((By.CLASS_NAME, target_class))
+                    for target_class in target_classes
+                ])
+                with metrics.timer('stage', stage='ing_wait', page_type=page_type):
+                    WebDriverWait(driver, self.max_delay).until(target)
+            except TimeoutException:
+                metrics.inc('ing_page_timeouts', page_type=page_type)
+                return None
+
+            page_source = driver.page_source
+            metrics.inc('ing_bytes', len(page_source), page_type=page_type)
+
+        return page_source
+
+    def __map(self, method, isins):
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            futures = {executor.submit(contextvars.copy_context().run, method, isin): isin for isin in isins}
+            for future in as_completed(futures):
+                # one page failing after its retries must not end the batch, its error is yielded instead
+                error = future.exception()
+                yield futures[future], None if error is not None else future.result(), error
+
+    def get_components(self, isin, refresh=False):
+        page_source = self.__load_page(self.__index_components_url + isin, 'components', 'last', refresh=refresh)
+        if page_source is None:
             return None
 
-        soup = BeautifulSoup(self.driver.page_source, 'html.parser')
-        table = soup.find_all('div', {'class': self.__contained_shares_class})
-        table_soup = BeautifulSoup(str(table), 'html.parser')
-        anchors = list(set(table_soup.find_all('a')))
+        from bs4 import BeautifulSoup
+
+        with metrics.timer('stage', stage='ing_parse', page_type='components'):
+            soup = BeautifulSoup(page_source, 'lxml')
+        anchors = soup.select('div.{cls} a'.format(cls=self.__contained_shares_class))
 
         components = dict((a.attrs['href'][-12:], (a.text, a.attrs['href'])) for a in anchors)
 
         return components
 
-    def get_financials_for_stock(self, isin):
-        self.driver.get(self.__stock_profile_url + isin)
-
-        try:
-            target = EC.presence_of_element_located((By.CLASS_NAME, 'row-change'))
-            WebDriverWait(self.driver, self.max_delay).until(target)
-        except TimeoutException:
+    def get_profile(self, isin, refresh=False):
+        """Load and parse the company profile page once, for all of its tables."""
+        page_source = self.__load_page(
+            self.__stock_profile_url + isin,
+            'profile',
+            *self.__profile_target_classes,
+            refresh=refresh
+        )
+        if page_source is None:
             return None
 
-        soup = BeautifulSoup(self.driver.page_source, 'html.parser')
-
-        pnl = self.__extract_table(
-            soup=soup,
-            class_name=self.__pnl_class,
-            table_fields=self.__pnl_fields,
-            vanity_names=self.__pnl_fields_vanity
-        )
+        from src.data.IngStockProfile import IngStockProfile
 
-        balance = self.__extract_table(
-            soup=soup,
-            class_name=self.__balance_sheet_class,
-            table_fields=self.__balance_fields,
-            vanity_names=self.__balance_fields_vanity
-        )
+        return IngStockProfile(isin, page_source)
 
-        return pnl, balance
+    def get_financials_for_stock(self, isin, refresh=False):
+        profile = self.get_profile(isin, refresh=refresh)
+        if profile is None:
+            return None
 
-    def get_market_cap(self, isin):
-        self.driver.get(self.__stock_profile_url + isin)
+        return profile.pnl(), profile.balance()
 
-        try:
-            target = EC.presence_of_element_located((By.CLASS_NAME, 'sh-table-cell-value'))
-            WebDriverWait(self.driver, self.max_delay).until(target)
-        except TimeoutException:
+    def get_market_cap(self, isin, refresh=False):
+        profile = self.get_profile(isin, refresh=refresh)
+        if profile is None:
             return None
 
-        soup = BeautifulSoup(self.driver.page_source, 'html.parser')
-        table = soup.find_all('div', {'class': self.__facts_class})
-        table_soup = BeautifulSoup(str(table), 'html.parser')
-        rows = list(set(table_soup.find_all('tr')))
+        return profile.market_cap()
+
+    def get_profiles(self, isins, refresh=False):
+        """Yield (isin, profile, error) as the pages finish loading on the driver pool.
+
+        The profile is None if the page did not load; error is the exception
+        of a page that failed, and None otherwise.
+        """
+        return self.__map(partial(self.get_profile, refresh=refresh), isins)
 
-        for fact in rows:
-            if fact.contents[0].text == self.__facts_key:
-                break
+    def get_financials_many(self, isins, refresh=False):
+        """Yield (isin, (pnl, balance), error) as the pages finish loading on the driver pool."""
+        return self.__map(partial(self.get_financials_for_stock, refresh=refresh), isins)
 
-        market_cap_str = fact.contents[1].text
-        market_cap = float(market_cap_str.split()[0].replace('.', ''))
+    def get_market_caps(self, isins, refresh=False):
+        """Yield (isin, market_cap, error) as the pages finish loading on the driver pool."""
+        return self.__map(partial(self.get_market_cap, refresh=refresh), isins)
 
-        return market_cap * self.__MILLION
+    def close(self):
+        with self.__pool_lock:
+            for driver in self.__drivers:
+                driver.quit()
+            self.__drivers.clear()
+            self.__idle_drivers = queue.Queue()
@@ -0,0 +1,81 @@
+"""
+Class definition for ING stock profile snapshot.
+"""
+from bs4 import BeautifulSoup
+import pandas as pd
+
+from src.monitoring.Metrics import metrics
+
+
+class IngStockProfile:
+    """Parsed snapshot of a wertpapiere.ing.de company profile page"""
+    __pnl_class = 'sh-share-income-statement'
+    __balance_sheet_class = 'sh-balance-sheet'
+    __facts_class = 'sh-facts-list'
+
+    __facts_key = 'Börsenwert'
+
+    __pnl_fields = ['turnover', 'resultOfOperations', 'incomeAfterTax']
+    __balance_fields = ['labelCurrentAssets', 'labelCapitalAssets', 'labelEquity', 'labelTotalLiabilities']
+
+    __pnl_fields_vanity = ['turnover', 'ebit', 'income']
+    __balance_fields_vanity = ['current_assets', 'capital_assets', 'equity', 'liabilities']
+
+    __MILLION = 10**6
+
+    def __init__(self, isin, page_source):
+        self.isin = isin
+        with metrics.timer('stage', stage='ing_parse', page_type='profile'):
+            self.soup = BeautifulSoup(page_source, 'lxml')
+
+    def __extract_table(self, class_name, table_fields, vanity_names):
+        def to_float(string):
+            if string in (None, '', '-'):
+                return 0.
+            return float(string.replace('.', '').replace(',', '.'))
+
+        def floatable(string):
+            try:
+                to_float(string)
+            except ValueError:
+                return False
+            return True
+
+        table_selector = 'div.{cls}'.format(cls=class_name)
+        result = pd.DataFrame(columns=['year'] + table_fields)
+
+        header = self.soup.select_one(table_selector + ' thead')
+        if header is None:
+            raise ValueError('no {cls} table on the profile of {isin}'.format(cls=class_name, isin=self.isin))
+        result['year'] = [int(tag.text) for tag in header.select('td[data-position]')]
+        for field in table_fields:
+            row = self.soup.select_one('{table} tr[data-row="{field}"]'.format(table=table_selector, field=field))
+            if row is None:
+                raise ValueError('no {field} row on the profile of {isin}'.format(field=field, isin=self.isin))
+            result[field] = [to_float(tag.text) * self.__MILLION for tag in row if floatable(tag.text)]
+        result.columns = ['year'] + vanity_names
+
+        return result
+
+    def pnl(self):
+        return self.__extract_table(
+            class_name=self.__pnl_class,
+            table_fields=self.__pnl_fields,
+            vanity_names=self.__pnl_fields_vanity
+        )
+
+    def balance(self):
+        return self.__extract_table(
+            class_name=self.__balance_sheet_class,
+            table_fields=self.__balance_fields,
+            vanity_names=self.__balance_fields_vanity
+        )
+
+    def market_cap(self):
+        for fact in self.soup.select('div.{cls} tr'.format(cls=self.__facts_class)):
+            cells = fact.find_all(['th', 'td'])
+            if len(cells) > 1 and cells[0].text == self.__facts_key:
+                market_cap = float(cells[1].text.split()[0].replace('.', ''))
+                return market_cap * self.__MILLION
+
+        return None
@@ -0,0 +1,73 @@
+"""
+Class definition for on-disk page cache.
+"""
+import datetime as dt
+import hashlib
+import os
+import uuid
+
+
+class PageCache:
+    """On-disk cache of rendered page sources keyed by URL
+
+    Pages are kept as files under path, or in a CacheBackend if one is given.
+    """
+    default_ttls = {
+        'components': dt.timedelta(days=7),
+        'profile': dt.timedelta(days=30)
+    }
+
+    __ENCODING = 'utf-8'
+    __namespace = 'ing_pages'
+
+    def __init__(self, path='data/pages', ttls=None, offline=False, backend=None):
+        self.path = path
+        self.ttls = dict(self.default_ttls, **(ttls or {}))
+        self.offline = offline
+        self.backend = backend
+        if self.backend is None:
+            os.makedirs(self.path, exist_ok=True)
+
+    def __file(self, url):
+        key = hashlib.sha256(url.encode(self.__ENCODING)).hexdigest()
+        return os.path.join(self.path, key + '.html')
+
+    def get(self, url, page_type):
+        """Return the cached page source, or None if it is missing or expired.
+
+        Offline mode replays whatever is cached regardless of its age.
+        """
+        ttl = self.ttls.get(page_type)
+        if self.backend is not None:
+            page_source = self.backend.get(self.__namespace, url, max_age=None if self.offline else ttl)
+            return None if page_source is None else page_source.decode(self.__ENCODING)
+
+        path = self.__file(url)
+        try:
+            stored = dt.datetime.fromtimestamp(os.path.getmtime(path))
+        except FileNotFoundError:
+            return None
+
+        if not self.offline and ttl is not None and dt.datetime.now() - stored > ttl:
+            return None
+
+        with open(path, encoding=self.__ENCODING) as f:
+            return f.read()
+
+    def put(self, url, page_source):
+        if self.backend is not None:
+            # kept regardless of age for offline replay, the backend's size bound evicts them
+            self.backend.put(self.__namespace, url, page_source.encode(self.__ENCODING))
+            return
+
+        path = self.__file(url)
+        # a temporary file of its own, so concurrent writers of one page never mix their writes
+        tmp_path = '{path}.{id}.tmp'.format(path=path, id=uuid.uuid4().hex)
+        try:
+            with open(tmp_path, 'w', encoding=self.__ENCODING) as f:
+                f.write(page_source)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
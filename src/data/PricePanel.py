@@ -0,0 +1,144 @@
+"""
+Class definition for calendar-aligned price panel.
+"""
+import numpy as np
+import pandas as pd
+
+
+class PricePanel:
+    """Bars of several tickers aligned on one master date axis
+
+    Every field is a contiguous (tickers x dates) float array, so one
+    ticker's history is a contiguous row. A boolean mask of the same shape
+    marks the dates a ticker actually traded; all other cells are NaN, which
+    keeps exchanges with different trading calendars on one axis. Slicing by
+    date range returns a panel of views into the same arrays.
+    """
+    fields = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+    __date_column = 'Date'
+
+    def __init__(self, dates, tickers, values, valid):
+        """
+        :param dates: sorted datetime64[ns] array of the master date axis
+        :param values: dict of field -> (tickers x dates) float array
+        :param valid: (tickers x dates) boolean array of the dates each ticker has a bar on
+        """
+        self.dates = pd.DatetimeIndex(dates, name=self.__date_column, copy=False)
+        self.tickers = list(tickers)
+        self.values = values
+        self.valid = valid
+
+        self.__positions = {ticker: position for position, ticker in enumerate(self.tickers)}
+
+    @classmethod
+    def from_frames(cls, frames, fields=None, start=None, end=None):
+        """Align data frames as returned by YahooDataLoader.fetch, keeping the bars within [start, end]."""
+        fields = list(fields or cls.fields)
+        tickers = [ticker for ticker, frame in frames.items() if frame is not None]
+
+        columns = list()
+        for ticker in tickers:
+            frame = frames[ticker]
+            dates = frame.index.to_numpy(dtype='datetime64[ns]')
+            first = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'ns'), side='left')
+            last = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, 'ns'), side='right')
+            columns.append((
+                dates[first:last],
+                {field: frame[field].to_numpy(dtype=float)[first:last] for field in fields}
+            ))
+
+        if not columns:
+            dates = np.empty(0, dtype='datetime64[ns]')
+        elif all(np.array_equal(column[0], columns[0][0]) for column in columns):
+            # tickers of one exchange share their calendar, which spares sorting the union
+            dates = columns[0][0]
+        else:
+            dates = np.unique(np.concatenate([column[0] for column in columns]))
+
+        values = {field: np.full((len(tickers), len(dates)), np.nan) for field in fields}
+        valid = np.zeros((len(tickers), len(dates)), dtype=bool)
+        for position, (column_dates, column_values) in enumerate(columns):
+            indices = np.searchsorted(dates, column_dates)
+            valid[position, indices] = True
+            for field in fields:
+                values[field][position, indices] = column_values[field]
+
+        return cls(dates, tickers, values, valid)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, ticker):
+        return ticker in self.__positions
+
+    def position(self, ticker):
+        return self.__positions[ticker]
+
+    def series(self, ticker, field, valid_only=True):
+        """Return one ticker's field, by default only on the dates it has a bar on."""
+        position = self.__positions[ticker]
+        values = self.values[field][position]
+        if not valid_only:
+            return pd.Series(values, index=self.dates, name=ticker, copy=False)
+
+        mask = self.valid[position]
+        return pd.Series(values[mask], index=self.dates[mask], name=ticker)
+
+    def frame(self, ticker, valid_only=True):
+        """Return one ticker's bars as a data frame in the layout of YahooDataLoader.fetch."""
+        return pd.DataFrame({field: self.series(ticker, field, valid_only) for field in self.values})
+
+    def field(self, field):
+        """Return a (dates x tickers) data frame of field, backed by the panel's array."""
+        return pd.DataFrame(self.values[field].T, index=self.dates, columns=self.tickers, copy=False)
+
+    def slice(self, start=None, end=None):
+        """Return the panel within [start, end] as views into this panel's arrays."""
+        first, last = 0, len(self.dates)
+        if start is not None:
+            first = self.dates.searchsorted(pd.Timestamp(start), side='left')
+        if end is not None:
+            last = self.dates.searchsorted(pd.Timestamp(end), side='right')
+
+        return PricePanel(
+            self.dates[first:last],
+            self.tickers,
+            {field: values[:, first:last] for field, values in self.values.items()},
+            self.valid[:, first:last]
+        )
+
+    def select(self, tickers):
+        """Return a panel of the given tickers, in that order; this copies the rows."""
+        positions = [self.__positions[ticker] for ticker in tickers]
+
+        return PricePanel(
+            self.dates,
+            tickers,
+            {field: values[positions] for field, values in self.values.items()},
+            self.valid[positions]
+        )
+
+    def forward_fill(self):
+        """Return a panel where dates without a bar carry the ticker's last values; the mask is kept."""
+        filled = np.where(self.valid, np.arange(len(self.dates)), 0)
+        np.maximum.accumulate(filled, axis=1, out=filled)
+        rows = np.arange(len(self.tickers))[:, None]
+
+        return PricePanel(
+            self.dates,
+            self.tickers,
+            {field: values[rows, filled] for field, values in self.values.items()},
+            self.valid
+        )
+
+    def rebase(self, field='Close', base=100.):
+        """Return a (dates x tickers) data frame of field relative to each ticker's first value, scaled to base."""
+        values = self.values[field]
+        has_bar = self.valid.any(axis=1)
+        first = values[np.arange(len(self.tickers)), self.valid.argmax(axis=1)]
+        first = np.where(has_bar, first, np.nan)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rebased = values / first[:, None] * base
+
+        return pd.DataFrame(rebased.T, index=self.dates, columns=self.tickers, copy=False)
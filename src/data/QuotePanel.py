@@ -0,0 +1,301 @@
+"""
+Class definition for shared memory-mapped quote panel.
+"""
+from contextlib import contextmanager
+import datetime as dt
+import fcntl
+import json
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import sys
+import threading
+import time
+
+from src.monitoring.Metrics import metrics
+
+
+class QuotePanel:
+    """Memory-mapped panel of OHLCV bars shared by all processes on a host
+
+    The bars of every ticker occupy one contiguous slice of fixed-width
+    arrays, one .npy file per column plus the date axis, located through a
+    ticker index. Readers map the files read-only, so all worker processes
+    share the same pages of the OS page cache and the frames handed out are
+    views into them.
+
+    A published generation is never modified. Writers build a new one and
+    switch the `current` pointer atomically under an exclusive file lock;
+    readers attach to it on their next access. Periodic refreshes are done
+    by whichever process holds the leader lock.
+    """
+    __date_column = 'Date'
+    __dtypes = {
+        'Open': 'float64',
+        'High': 'float64',
+        'Low': 'float64',
+        'Close': 'float64',
+        'Adj Close': 'float64',
+        'Volume': 'int64'
+    }
+    __pointer_file = 'current'
+    __index_file = 'index.json'
+    __write_lock_file = 'write.lock'
+    __leader_lock_file = 'leader.lock'
+    __generation_prefix = 'gen-'
+
+    __DATE_FORMAT = '%Y-%m-%d'
+
+    def __init__(self, path='data/panel', freq='1d', keep=3):
+        """
+        :param keep: number of generations kept on disk, readers may still map the older ones
+        """
+        self.path = path
+        self.freq = freq
+        self.keep = keep
+        os.makedirs(self.path, exist_ok=True)
+
+        self.__generation = None
+        self.__index = dict()
+        self.__arrays = dict()
+        self.__lock = threading.Lock()
+
+        self.__leader_file = None
+        self.__refresher_pid = None
+
+    @staticmethod
+    def __file_name(column):
+        return column.lower().replace(' ', '_') + '.npy'
+
+    def __current(self):
+        try:
+            with open(os.path.join(self.path, self.__pointer_file)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def __attach(self, generation):
+        generation_dir = os.path.join(self.path, generation)
+        with open(os.path.join(generation_dir, self.__index_file)) as f:
+            index = json.load(f)
+        arrays = {
+            column: np.asarray(np.load(os.path.join(generation_dir, self.__file_name(column)), mmap_mode='r'))
+            for column in [self.__date_column] + list(self.__dtypes)
+        }
+
+        return index, arrays
+
+    def __view(self):
+        """Return the ticker index and the arrays of the current generation."""
+        while True:
+            generation = self.__current()
+            with self.__lock:
+                if generation == self.__generation:
+                    return self.__index, self.__arrays
+                if generation is None:
+                    return dict(), dict()
+                try:
+                    self.__index, self.__arrays = self.__attach(generation)
+                except FileNotFoundError:
+                    # purged by a writer between reading the pointer and mapping the files
+                    continue
+                self.__generation = generation
+                metrics.inc('quote_panel_attaches')
+                return self.__index, self.__arrays
+
+    def tickers(self):
+        return list(self.__view()[0])
+
+    def coverage(self, ticker):
+        """Return the (start, end) period held for ticker, or None."""
+        entry = self.__view()[0].get(ticker)
+        if entry is None:
+            return None
+
+        return (
+            dt.datetime.strptime(entry['start'], self.__DATE_FORMAT),
+            dt.datetime.strptime(entry['end'], self.__DATE_FORMAT)
+        )
+
+    def covers(self, ticker, start, end):
+        covered = self.coverage(ticker)
+        return covered is not None and covered[0] <= start and end <= covered[1]
+
+    def frame(self, ticker, start=None, end=None):
+        """Return the bars of ticker within [start, end] as a read-only frame backed by the shared arrays."""
+        index, arrays = self.__view()
+        entry = index.get(ticker)
+        if entry is None:
+            return None
+
+        offset, length = entry['offset'], entry['length']
+        dates = arrays[self.__date_column][offset:offset + length]
+        first = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'ns'), side='left')
+        last = length if end is None else np.searchsorted(dates, np.datetime64(end, 'ns'), side='right')
+
+        return pd.DataFrame(
+            {column: arrays[column][offset + first:offset + last] for column in self.__dtypes},
+            index=pd.DatetimeIndex(dates[first:last], name=self.__date_column, copy=False),
+            copy=False
+        )
+
+    def frames(self, tickers, start=None, end=None):
+        frames = dict()
+        for ticker in tickers:
+            data = self.frame(ticker, start, end)
+            if data is not None:
+                frames[ticker] = data
+
+        return frames
+
+    @contextmanager
+    def __write_lock(self):
+        with open(os.path.join(self.path, self.__write_lock_file), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def update(self, entries):
+        """Publish a new generation with the bars of entries, an iterable of (ticker, start, end, data).
+
+        Bars for a period that overlaps or touches the one already held are
+        merged into it, otherwise they replace the ticker's bars.
+        """
+        entries = list(entries)
+        if not entries:
+            return
+
+        with self.__write_lock(), metrics.timer('stage', stage='quote_panel_update'):
+            index, arrays = self.__view()
+            tickers = dict()
+            for ticker, entry in index.items():
+                offset, length = entry['offset'], entry['length']
+                tickers[ticker] = (
+                    dt.datetime.strptime(entry['start'], self.__DATE_FORMAT),
+                    dt.datetime.strptime(entry['end'], self.__DATE_FORMAT),
+                    {column: values[offset:offset + length] for column, values in arrays.items()}
+                )
+
+            # bars of the current day are still moving, so never mark them as covered
+            today = dt.datetime.combine(dt.date.today(), dt.time())
+            for ticker, start, end, data in entries:
+                end = min(end, today)
+                if ticker in tickers and start <= tickers[ticker][1] and tickers[ticker][0] <= end:
+                    held_start, held_end, held = tickers[ticker]
+                    data = pd.concat([self.__to_frame(held), data])
+                    start, end = min(start, held_start), max(end, held_end)
+                data = data[~data.index.duplicated(keep='last')].sort_index()
+                tickers[ticker] = (start, end, self.__to_columns(data))
+
+            self.__publish(tickers)
+
+        self.__purge()
+
+    def __to_frame(self, columns):
+        return pd.DataFrame(
+            {column: columns[column] for column in self.__dtypes},
+            index=pd.DatetimeIndex(columns[self.__date_column], name=self.__date_column)
+        )
+
+    def __to_columns(self, data):
+        columns = {self.__date_column: data.index.to_numpy(dtype='datetime64[ns]')}
+        for column, dtype in self.__dtypes.items():
+            columns[column] = data[column].to_numpy(dtype=dtype, na_value=0 if dtype == 'int64' else np.nan)
+
+        return columns
+
+    def __publish(self, tickers):
+        generation = '{prefix}{stamp:020d}'.format(prefix=self.__generation_prefix, stamp=time.time_ns())
+        generation_dir = os.path.join(self.path, generation)
+        tmp_dir = generation_dir + '.tmp'
+        os.makedirs(tmp_dir)
+
+        index = dict()
+        offset = 0
+        for ticker, (start, end, columns) in tickers.items():
+            length = len(columns[self.__date_column])
+            index[ticker] = {
+                'offset': offset,
+                'length': length,
+                'start': start.strftime(self.__DATE_FORMAT),
+                'end': end.strftime(self.__DATE_FORMAT)
+            }
+            offset += length
+
+        dtypes = dict(self.__dtypes, **{self.__date_column: 'datetime64[ns]'})
+        for column, dtype in dtypes.items():
+            values = [columns[column] for _, _, columns in tickers.values()]
+            np.save(
+                os.path.join(tmp_dir, self.__file_name(column)),
+                np.concatenate(values).astype(dtype, copy=False) if values else np.empty(0, dtype=dtype)
+            )
+        with open(os.path.join(tmp_dir, self.__index_file), 'w') as f:
+            json.dump(index, f)
+        os.rename(tmp_dir, generation_dir)
+
+        pointer = os.path.join(self.path, self.__pointer_file)
+        with open(pointer + '.tmp', 'w') as f:
+            f.write(generation)
+        os.replace(pointer + '.tmp', pointer)
+
+    def __purge(self):
+        # unlinking files another process still maps is safe, its mapping stays valid
+        generations = sorted(
+            name for name in os.listdir(self.path)
+            if name.startswith(self.__generation_prefix) and not name.endswith('.tmp')
+        )
+        for name in generations[:-self.keep]:
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def lead(self):
+        """Try to become the process that refreshes the panel; returns True while it holds the leadership.
+
+        The leader lock is released by the OS when its process exits, so another one takes over.
+        """
+        if self.__leader_file is None:
+            f = open(os.path.join(self.path, self.__leader_lock_file), 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return False
+            self.__leader_file = f
+
+        return True
+
+    def refresh(self, loader, end=None):
+        """Extend every ticker to end with bars from loader, if this process is the leader."""
+        if not self.lead():
+            return False
+
+        end = end or dt.datetime.combine(dt.date.today(), dt.time())
+        entries = list()
+        for ticker in self.tickers():
+            start, _ = self.coverage(ticker)
+            try:
+                entries.append((ticker, start, end, loader.fetch(ticker, start, end, self.freq)))
+            except Exception as error:
+                metrics.inc('quote_panel_refresh_errors')
+                print('refresh of {ticker} failed: {error}'.format(ticker=ticker, error=error), file=sys.stderr)
+        self.update(entries)
+
+        return True
+
+    def start_refresher(self, loader, interval=3600):
+        """Start a background thread refreshing the panel every interval seconds while this process leads.
+
+        Threads do not survive a fork, so it is safe to call this again in every worker process.
+        """
+        if self.__refresher_pid == os.getpid():
+            return
+        self.__refresher_pid = os.getpid()
+
+        def _refresh():
+            while True:
+                time.sleep(interval)
+                self.refresh(loader)
+
+        threading.Thread(target=_refresh, daemon=True).start()
@@ -0,0 +1,141 @@
+"""
+Class definition for local quote store.
+"""
+from contextlib import contextmanager
+import datetime as dt
+import fcntl
+import json
+import os
+import pandas as pd
+import uuid
+
+
+class QuoteStore:
+    """Parquet-backed on-disk store of OHLCV bars keyed by ticker and interval
+
+    Writers of one ticker and interval, whether threads or processes, take
+    turns on a file lock, so the coverage never claims bars the parquet file
+    does not hold.
+    """
+    __DATE_FORMAT = '%Y-%m-%d'
+
+    def __init__(self, path='data/quotes'):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def __file(self, ticker, freq, extension):
+        name = '{ticker}_{freq}.{ext}'.format(ticker=ticker, freq=freq, ext=extension)
+        return os.path.join(self.path, name.replace('%', '_').replace('/', '_'))
+
+    @staticmethod
+    def __atomic_write(path, write):
+        tmp_path = '{path}.{id}.tmp'.format(path=path, id=uuid.uuid4().hex)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @contextmanager
+    def __write_lock(self, ticker, freq):
+        # flock is held per open file, so it also keeps threads of one process apart
+        with open(self.__file(ticker, freq, 'lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def coverage(self, ticker, freq):
+        """Return the (start, end) period already stored for ticker and freq, or None."""
+        try:
+            with open(self.__file(ticker, freq, 'json')) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        return (
+            dt.datetime.strptime(meta['start'], self.__DATE_FORMAT),
+            dt.datetime.strptime(meta['end'], self.__DATE_FORMAT)
+        )
+
+    def missing(self, ticker, freq, start, end):
+        """Return the periods that need to be downloaded to serve [start, end].
+
+        The stored period is always kept contiguous, so a request that lies
+        entirely before or after it also fills the gap in between.
+        """
+        covered = self.coverage(ticker, freq)
+        if covered is None:
+            return [(start, end)]
+
+        covered_start, covered_end = covered
+        gaps = list()
+        if start < covered_start:
+            gaps.append((start, covered_start))
+        if end > covered_end:
+            gaps.append((covered_end, end))
+
+        return gaps
+
+    def merge(self, ticker, freq, start, end, data):
+        """Merge downloaded bars for [start, end] into the store."""
+        # bars of the current day are still moving, so never mark them as covered
+        today = dt.datetime.combine(dt.date.today(), dt.time())
+        end = min(end, today)
+
+        with self.__write_lock(ticker, freq):
+            stored = self.__load(ticker, freq)
+            if stored is not None:
+                data = pd.concat([stored, data])
+            data = data[~data.index.duplicated(keep='last')].sort_index()
+
+            # another writer may have stored a period since the gaps were computed; one
+            # that does not touch [start, end] keeps its coverage, as the hole between
+            # them is not stored
+            covered = self.coverage(ticker, freq)
+            if covered is not None:
+                if start > covered[1] or end < covered[0]:
+                    start, end = covered
+                else:
+                    start, end = min(start, covered[0]), max(end, covered[1])
+
+            self.__atomic_write(
+                self.__file(ticker, freq, 'parquet'),
+                lambda path: data.to_parquet(path)
+            )
+            meta = {'start': start.strftime(self.__DATE_FORMAT), 'end': end.strftime(self.__DATE_FORMAT)}
+            self.__atomic_write(
+                self.__file(ticker, freq, 'json'),
+                lambda path: self.__dump_json(meta, path)
+            )
+
+    def drop(self, ticker, freq):
+        """Remove the stored bars of ticker and freq, e.g. after the provider revised its history."""
+        with self.__write_lock(ticker, freq):
+            for extension in ('json', 'parquet'):
+                try:
+                    os.remove(self.__file(ticker, freq, extension))
+                except FileNotFoundError:
+                    pass
+
+    def read(self, ticker, freq, start, end):
+        """Return the stored bars within [start, end]."""
+        data = self.__load(ticker, freq)
+        if data is None:
+            return None
+
+        return data.loc[start:end]
+
+    def __load(self, ticker, freq):
+        try:
+            return pd.read_parquet(self.__file(ticker, freq, 'parquet'))
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def __dump_json(obj, path):
+        with open(path, 'w') as f:
+            json.dump(obj, f)
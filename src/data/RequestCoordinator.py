@@ -0,0 +1,102 @@
+"""
+Class definition for shared outbound request coordinator.
+"""
+from concurrent.futures import Future
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+from src.data.RateLimiter import RateLimiter
+from src.monitoring.Metrics import metrics
+
+
+class RequestCoordinator:
+    """Request layer shared by the Yahoo loader and the ING scraper
+
+    - singleflight: concurrent calls with the same key share one in-flight call
+    - per-host token-bucket rate limits
+    - retries of transient failures with full-jitter exponential backoff
+    """
+
+    def __init__(self, rates=None, default_rate=None, burst=1, retries=3, backoff=0.5, max_backoff=8.):
+        """
+        :param rates: dict of host name -> requests per second
+        :param default_rate: requests per second for other hosts, None for no limit
+        """
+        self.rates = rates or {}
+        self.default_rate = default_rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.__limiters = dict()
+        self.__in_flight = dict()
+        self.__lock = threading.Lock()
+
+    def with_rates(self, rates):
+        """Return a coordinator with the same settings whose limits for the given hosts are replaced."""
+        return RequestCoordinator(
+            dict(self.rates, **rates),
+            default_rate=self.default_rate,
+            burst=self.burst,
+            retries=self.retries,
+            backoff=self.backoff,
+            max_backoff=self.max_backoff
+        )
+
+    def __limiter(self, host):
+        with self.__lock:
+            if host not in self.__limiters:
+                rate = self.rates.get(host, self.default_rate)
+                self.__limiters[host] = RateLimiter(rate, self.burst) if rate else None
+            return self.__limiters[host]
+
+    def singleflight(self, key, fn, *args, **kwargs):
+        """Run fn unless a call with the same key is in flight, in which case share its outcome."""
+        with self.__lock:
+            future = self.__in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.__in_flight[key] = future
+
+        if not leader:
+            metrics.inc('singleflight_shared')
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.__lock:
+                del self.__in_flight[key]
+
+    def request(self, url, fn, *args, retryable=None, **kwargs):
+        """Call fn under the rate limit of the url's host, retrying errors that retryable accepts."""
+        host = urlparse(url).hostname
+        limiter = self.__limiter(host)
+
+        for attempt in range(self.retries + 1):
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as error:
+                if attempt == self.retries or (retryable is not None and not retryable(error)):
+                    raise
+                metrics.inc('request_retries', host=host)
+                time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt)))
+
+
+yahoo_hosts = ['finance.yahoo.com', 'query1.finance.yahoo.com']
+
+request_coordinator = RequestCoordinator(
+    rates=dict(dict.fromkeys(yahoo_hosts, 5.), **{'wertpapiere.ing.de': 2.})
+)
@@ -0,0 +1,157 @@
+"""
+Class definition for SQLite cache backend.
+"""
+from contextlib import contextmanager
+import datetime as dt
+import os
+import sqlite3
+import threading
+import time
+
+from src.data.CacheBackend import CacheBackend
+from src.monitoring.Metrics import metrics
+
+
+class SqliteCacheBackend(CacheBackend):
+    """Cache backend in a local SQLite database shared by all processes on the host
+
+    The database runs in WAL mode, so readers in any number of processes
+    never block and never see a partial write, while writers take turns on
+    the database lock. Every write is one transaction that also evicts
+    expired entries and, once the stored values exceed max_bytes, the least
+    recently used ones.
+    """
+    __schema = [
+        'CREATE TABLE IF NOT EXISTS entries ('
+        'namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, '
+        'stored REAL NOT NULL, expires REAL, accessed REAL NOT NULL, PRIMARY KEY (namespace, key))',
+        'CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)',
+        'CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)'
+    ]
+    # reads only record their access time this often, so hits rarely need the write lock
+    __touch_interval = 60
+
+    def __init__(self, path='data/cache.sqlite', max_bytes=1024 * 2**20, busy_timeout=30):
+        """
+        :param max_bytes: bound on the total size of the stored values
+        :param busy_timeout: seconds a writer waits for the database lock
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.busy_timeout = busy_timeout
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        self.__local = threading.local()
+        self.__connections = list()
+        self.__lock = threading.Lock()
+
+        with self.__transaction() as connection:
+            for statement in self.__schema:
+                connection.execute(statement)
+
+    def __connection(self):
+        # sqlite connections must not cross threads or survive a fork, e.g. into a Dash worker
+        if getattr(self.__local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.__local.connection = connection
+            self.__local.pid = os.getpid()
+            with self.__lock:
+                self.__connections.append((os.getpid(), connection))
+
+        return self.__local.connection
+
+    @contextmanager
+    def __transaction(self):
+        # the database lock is taken up front, so concurrent writers queue instead of failing on upgrade
+        connection = self.__connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    @staticmethod
+    def __seconds(duration):
+        return duration.total_seconds() if isinstance(duration, dt.timedelta) else duration
+
+    def get(self, namespace, key, max_age=None):
+        now = time.time()
+        row = self.__connection().execute(
+            'SELECT value, stored, expires, accessed FROM entries WHERE namespace = ? AND key = ?',
+            (namespace, key)
+        ).fetchone()
+
+        if row is None or (row[2] is not None and row[2] <= now) or \
+                (max_age is not None and now - row[1] > self.__seconds(max_age)):
+            metrics.inc('cache_misses', cache='backend_' + namespace)
+            return None
+
+        if now - row[3] > self.__touch_interval:
+            with self.__transaction() as connection:
+                connection.execute(
+                    'UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?',
+                    (now, namespace, key)
+                )
+
+        metrics.inc('cache_hits', cache='backend_' + namespace)
+        return row[0]
+
+    def put(self, namespace, key, value, ttl=None):
+        now = time.time()
+        expires = None if ttl is None else now + self.__seconds(ttl)
+        if len(value) > self.max_bytes:
+            return
+
+        with self.__transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO entries (namespace, key, value, size, stored, expires, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (namespace, key, sqlite3.Binary(value), len(value), now, expires, now)
+            )
+            self.__evict(connection, now)
+
+    def __evict(self, connection, now):
+        evicted = connection.execute('DELETE FROM entries WHERE expires <= ?', (now,)).rowcount
+
+        excess = connection.execute('SELECT total(size) FROM entries').fetchone()[0] - self.max_bytes
+        if excess > 0:
+            rows = list()
+            for rowid, size in connection.execute('SELECT rowid, size FROM entries ORDER BY accessed'):
+                rows.append((rowid,))
+                excess -= size
+                if excess <= 0:
+                    break
+            connection.executemany('DELETE FROM entries WHERE rowid = ?', rows)
+            evicted += len(rows)
+
+        if evicted:
+            metrics.inc('cache_evictions', evicted, cache='backend')
+
+    def delete(self, namespace, key):
+        with self.__transaction() as connection:
+            connection.execute('DELETE FROM entries WHERE namespace = ? AND key = ?', (namespace, key))
+
+    def clear(self, namespace=None):
+        with self.__transaction() as connection:
+            if namespace is None:
+                connection.execute('DELETE FROM entries')
+            else:
+                connection.execute('DELETE FROM entries WHERE namespace = ?', (namespace,))
+
+    def close(self):
+        with self.__lock:
+            # connections inherited through a fork belong to the parent process
+            for pid, connection in self.__connections:
+                if pid == os.getpid():
+                    connection.close()
+            self.__connections.clear()
+        self.__local = threading.local()
@@ -1,60 +1,341 @@
 """
 Class definition for Yahoo data loader.
 """
-from bs4 import BeautifulSoup
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import contextvars
 import datetime as dt
-import pandas as pd
+import hashlib
+import io
 import re
 import requests
+from requests.adapters import HTTPAdapter
+import threading
+import time
+
+from src.data.RequestCoordinator import request_coordinator
+from src.monitoring.Metrics import metrics
 
 
 class YahooDataLoader:
     """Data loader for finance.yahoo.com"""
     __base_url = 'https://finance.yahoo.com/'
-    __url_data = 'https://finance.yahoo.com/quote/{ticker}/history'
-    __url_data_download = 'https://query1.finance.yahoo.com/v7/finance/download/{ticker}?' \
+    __url_data = '{host}/quote/{ticker}/history'
+    __url_data_download = '{host}/v7/finance/download/{ticker}?' \
         'period1={start}&period2={end}&interval={freq}&events=history&crumb={crumb}'
 
     __ticker_class = 'D(ib) Fz(18px)'
 
+    __header = {
+        'Connection': 'keep-alive',
+        'Expires': '-1',
+        'Upgrade-Insecure-Requests': '1',
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) ' \
+            'AppleWebKit/537.36 (KHTML, like Gecko) ' \
+            'Chrome/80.0.3987.132 Safari/537.36'
+    }
+
+    __crumb_pattern = re.compile('"CrumbStore":{"crumb":"(.+?)"}')
+    __rejected_status_codes = (401, 403)
+    __transient_status_codes = (429, 500, 502, 503, 504)
+
+    __date_column = 'Date'
+    __volume_column = 'Volume'
+    __price_dtypes = dict.fromkeys(['Open', 'High', 'Low', 'Close', 'Adj Close'], 'float64')
+    __na_values = ['null']
+
+    __daily_freq = '1d'
+    __resample_rules = {'1wk': 'W-MON', '1mo': 'MS'}
+    __resample_aggregations = {
+        'Open': 'first',
+        'High': 'max',
+        'Low': 'min',
+        'Close': 'last',
+        'Adj Close': 'last',
+        'Volume': 'sum'
+    }
+    __resampled_cache_size = 128
+    __cache_namespace = 'yahoo'
+
     __SEPARATOR = ','
 
-    def __get_cookies_and_crumbs(self, ticker):
-        url = self.__url_data.format(ticker=ticker)
-
-        with requests.session():
-            header = {
-                'Connection': 'keep-alive',
-                'Expires': '-1',
-                'Upgrade-Insecure-Requests': '1',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) ' \
-                    'AppleWebKit/537.36 (KHTML, like Gecko) ' \
-                    'Chrome/80.0.3987.132 Safari/537.36'
-            }
-            website = requests.get(url, headers=header)
-            soup = BeautifulSoup(website.text, 'html.parser')
-            crumb = re.findall('"CrumbStore":{"crumb":"(.+?)"}', str(soup))
-            self.cookies = website.cookies  # ToDo: delete
-            return header, website.cookies, crumb[0]
+    def __init__(self, store=None, crumb_ttl=dt.timedelta(hours=1), pool_size=10, max_workers=8, resample=True,
+                 timeout=10, host='https://finance.yahoo.com', download_host='https://query1.finance.yahoo.com',
+                 coordinator=None, cache=None, cache_ttl=dt.timedelta(hours=12),
+                 recent_cache_ttl=dt.timedelta(minutes=15)):
+        """
+        :param cache: CacheBackend that shares downloaded responses with other processes
+        :param cache_ttl: lifetime of cached responses, bounding how long revised history is missed
+        :param recent_cache_ttl: lifetime of cached responses whose range reaches into the last days
+        """
+        self.store = store
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.recent_cache_ttl = recent_cache_ttl
+        self.coordinator = coordinator or request_coordinator
+        self.host = host
+        self.download_host = download_host
+        self.timeout = timeout
+        self.resample = resample
+        self.crumb_ttl = crumb_ttl
+        self.max_workers = max_workers
 
-    def fetch(self, ticker, start, end, freq):
+        self.session = requests.Session()
+        self.session.headers.update(self.__header)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.__crumb = None
+        self.__crumb_expiry = None
+        self.__crumb_lock = threading.Lock()
+
+        self.__resampled = OrderedDict()
+        self.__resampled_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __get(self, url):
+        response = self.session.get(url, timeout=self.timeout)
+        if response.status_code in self.__transient_status_codes:
+            response.raise_for_status()
+
+        return response
+
+    @staticmethod
+    def __is_transient(error):
+        # HTTP errors only escape __get for the transient status codes
+        return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.HTTPError))
+
+    def __request(self, url):
+        return self.coordinator.request(url, self.__get, url, retryable=self.__is_transient)
+
+    def __get_crumb(self, ticker, refresh=False):
+        # cookies and crumb belong to the session, not to the ticker, so they
+        # are requested once and reused until they expire or get rejected
+        with self.__crumb_lock:
+            if refresh or self.__crumb is None or dt.datetime.now() >= self.__crumb_expiry:
+                metrics.inc('yahoo_crumb_refreshes')
+                url = self.__url_data.format(host=self.host, ticker=ticker)
+                with metrics.timer('stage', stage='yahoo_crumb'):
+                    website = self.__request(url)
+                crumb = self.__crumb_pattern.search(website.text).group(1)
+                self.__crumb = crumb.encode().decode('unicode_escape')
+                self.__crumb_expiry = dt.datetime.now() + self.crumb_ttl
+
+            return self.__crumb
+
+    def __download(self, ticker, start, end, freq, cached=True):
         def _date_to_seconds(date):
             return int((date-dt.datetime(1970, 1, 1)).total_seconds())
 
-        header, cookies, crumb = self.__get_cookies_and_crumbs(ticker)
+        key = '{ticker}/{start}/{end}/{freq}'.format(
+            ticker=ticker,
+            start=_date_to_seconds(start),
+            end=_date_to_seconds(end),
+            freq=freq
+        )
+        if self.cache is not None and cached:
+            content = self.cache.get(self.__cache_namespace, key)
+            if content is not None:
+                with metrics.timer('stage', stage='yahoo_decode'):
+                    return self.__decode(content)
 
-        with requests.session():
+        def _request(crumb):
             url = self.__url_data_download.format(
+                host=self.download_host,
                 ticker=ticker,
                 start=str(_date_to_seconds(start)),
                 end=str(_date_to_seconds(end)),
                 freq=freq,
                 crumb=crumb
             )
-            website = requests.get(url, headers=header, cookies=cookies)
+            return self.__request(url)
+
+        crumb = self.__get_crumb(ticker)
+        with metrics.timer('stage', stage='yahoo_download'):
+            website = _request(crumb)
+        if website.status_code in self.__rejected_status_codes:
+            metrics.inc('yahoo_rejected_downloads')
+            crumb = self.__get_crumb(ticker, refresh=True)
+            with metrics.timer('stage', stage='yahoo_download'):
+                website = _request(crumb)
+
+        website.raise_for_status()
+        metrics.inc('yahoo_downloads')
+        metrics.inc('yahoo_bytes', len(website.content))
+
+        if self.cache is not None:
+            # the latest bars still change during the trading day
+            recent = end >= dt.datetime.now() - dt.timedelta(days=3)
+            self.cache.put(
+                self.__cache_namespace,
+                key,
+                website.content,
+                ttl=self.recent_cache_ttl if recent else self.cache_ttl
+            )
+
+        with metrics.timer('stage', stage='yahoo_decode'):
+            return self.__decode(website.content)
+
+    def __decode(self, content):
+        import pandas as pd
+
+        data = pd.read_csv(
+            io.BytesIO(content),
+            sep=self.__SEPARATOR,
+            index_col=self.__date_column,
+            parse_dates=[self.__date_column],
+            na_values=self.__na_values,
+            dtype=self.__price_dtypes
+        )
+        data = data.dropna(how='all', subset=list(self.__price_dtypes))
+        data[self.__volume_column] = data[self.__volume_column].fillna(0).astype('int64')
+
+        return data
+
+    def __resample(self, ticker, daily, freq):
+        # keyed on the content of the daily bars it was derived from, so a refreshed
+        # daily series, e.g. with revised adjusted closes, never serves stale coarser bars
+        digest = hashlib.blake2b(daily.index.asi8.tobytes(), digest_size=16)
+        columns = list(self.__price_dtypes) + [self.__volume_column]
+        digest.update(daily[columns].to_numpy(dtype='float64').tobytes())
+        key = (ticker, freq, digest.hexdigest())
+        with self.__resampled_lock:
+            if key in self.__resampled:
+                metrics.inc('cache_hits', cache='resampled')
+                self.__resampled.move_to_end(key)
+                return self.__resampled[key]
+
+        metrics.inc('cache_misses', cache='resampled')
+        rule = self.__resample_rules[freq]
+        data = daily.resample(rule, label='left', closed='left').agg(self.__resample_aggregations)
+        data = data.dropna(subset=['Open'])
+        data[self.__volume_column] = data[self.__volume_column].astype('int64')
+
+        with self.__resampled_lock:
+            self.__resampled[key] = data
+            if len(self.__resampled) > self.__resampled_cache_size:
+                self.__resampled.popitem(last=False)
+
+        return data
+
+    def fetch(self, ticker, start, end, freq):
+        # identical concurrent requests, e.g. several users loading the default dashboard, share one fetch
+        key = ('yahoo', self.download_host, ticker, start, end, freq)
+        return self.coordinator.singleflight(key, self.__fetch, ticker, start, end, freq)
+
+    def __period_bounds(self, start, end, freq):
+        """Widen [start, end] to the whole weeks or months it touches, but not beyond today."""
+        first = dt.datetime.combine(start.date(), dt.time())
+        last = dt.datetime.combine(end.date(), dt.time())
+        if freq == '1wk':
+            first -= dt.timedelta(days=first.weekday())
+            last += dt.timedelta(days=6 - last.weekday())
+        else:
+            first = first.replace(day=1)
+            last = (last.replace(day=28) + dt.timedelta(days=4)).replace(day=1) - dt.timedelta(days=1)
+        today = dt.datetime.combine(dt.date.today(), dt.time())
+
+        return first, max(end, min(last, today))
+
+    def __fetch(self, ticker, start, end, freq):
+        if self.resample and freq in self.__resample_rules:
+            # a bar is only built from a whole period of daily bars, as a partial one would
+            # replace the full bar of that period wherever bars are merged by date; bars of
+            # periods starting before start are left out
+            first, last = self.__period_bounds(start, end, freq)
+            daily = self.fetch(ticker, first, last, self.__daily_freq)
+            data = self.__resample(ticker, daily, freq)
+            return data.loc[dt.datetime.combine(start.date(), dt.time()):]
+
+        if self.store is None:
+            return self.__download(ticker, start, end, freq)
+
+        gaps = self.store.missing(ticker, freq, start, end)
+        metrics.inc('cache_misses' if gaps else 'cache_hits', cache='quote_store')
+        for gap_start, gap_end in gaps:
+            data = self.__download(ticker, gap_start, gap_end, freq)
+            self.store.merge(ticker, freq, gap_start, gap_end, data)
+
+        return self.store.read(ticker, freq, start, end)
+
+    def download(self, ticker, start, end, freq):
+        """Download bars for [start, end] straight from Yahoo, bypassing the store, the cache and the local resampling.
+
+        The response still replaces the cached one for other processes.
+        """
+        return self.__download(ticker, start, end, freq, cached=False)
+
+    def iter_fetch(self, tickers, start, end, freq, max_workers=None, timeout=None):
+        """Fetch several tickers concurrently, yielding (ticker, data, error) as they complete.
+
+        Every ticker gets timeout seconds from the start of its download. Tickers
+        still waiting for a worker are given up once no download has started or
+        finished for timeout seconds. Both are yielded with a TimeoutError.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        started = dict()
+
+        def _fetch(ticker):
+            started[ticker] = time.monotonic()
+            return self.fetch(ticker, start, end, freq)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers or self.max_workers)
+        # each download runs in a copy of the caller's context, which carries the trace id
+        futures = {executor.submit(contextvars.copy_context().run, _fetch, ticker): ticker for ticker in tickers}
+        pending = set(futures)
+        progress = time.monotonic()
+
+        try:
+            while pending:
+                wait_timeout = None
+                if timeout is not None:
+                    last_event = max([progress] + list(started.values()))
+                    deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+                    wait_timeout = max(min(deadlines + [last_event + timeout]) - time.monotonic(), 0)
+
+                done, pending = wait(pending, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    progress = time.monotonic()
+                    try:
+                        yield futures[future], future.result(), None
+                    except Exception as error:
+                        yield futures[future], None, error
+
+                if timeout is None:
+                    continue
+                # downloads that finished while the caller handled a result are collected by the next wait
+                now = time.monotonic()
+                last_event = max([progress] + list(started.values()))
+                for future in [f for f in pending if not f.done()]:
+                    ticker = futures[future]
+                    if now - started.get(ticker, last_event) >= timeout:
+                        pending.discard(future)
+                        yield ticker, None, TimeoutError('no response for {ticker}'.format(ticker=ticker))
+        finally:
+            # hung downloads must not block the caller once their results are given up
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def fetch_many(self, tickers, start, end, freq, max_workers=None, timeout=None):
+        """Fetch several tickers concurrently.
+
+        Returns a dict of data frames and a dict of exceptions, both keyed by ticker.
+        """
+        results = dict()
+        errors = dict()
 
-            data = website.text.split('\n')
+        for ticker, data, error in self.iter_fetch(tickers, start, end, freq, max_workers, timeout):
+            if error is None:
+                results[ticker] = data
+            else:
+                errors[ticker] = error
 
-        names = data.pop(0).split(self.__SEPARATOR)
+        return results, errors
 
-        return pd.DataFrame([row.split(self.__SEPARATOR) for row in data], columns=names)
+    def close(self):
+        self.session.close()
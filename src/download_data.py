@@ -6,11 +6,16 @@ import plotly.graph_objects as go
 import plotly.offline as plt
 from src.data.YahooDataLoader import YahooDataLoader
 from src.data.IngDataScraper import IngDataScraper
+from src.data.PageCache import PageCache
+from src.data.SqliteCacheBackend import SqliteCacheBackend
 from src.finance.components.StockMarketIndex import StockMarketIndex
 
 
+# responses are shared with the dashboard and other scripts through the local cache
+cache_backend = SqliteCacheBackend()
+
 # download quotes from Yahoo finance
-dl = YahooDataLoader()
+dl = YahooDataLoader(cache=cache_backend)
 
 data = dl.fetch(
     ticker='%5EGDAXI',
@@ -20,27 +25,24 @@ data = dl.fetch(
 )
 
 fig = go.Figure(
-    data=go.Scatter(x=data['Date'], y=data['Close']),
+    data=go.Scatter(x=data.index, y=data['Close']),
     layout={'yaxis': {'tickformat': ','}}
 )
 plt.plot(fig)
 
 
-# download stock index components
-ing_scraper = IngDataScraper()
-
-components = ing_scraper.get_components('DE0008469008')
-print(*list(components.keys()), sep='\n')
-
-
-# get market capitalisation for stock
-ing_scraper.get_market_cap('DE0005200000')
+with IngDataScraper(cache=PageCache(backend=cache_backend)) as ing_scraper:
+    # download stock index components
+    components = ing_scraper.get_components('DE0008469008')
+    print(*list(components.keys()), sep='\n')
 
+    # get market capitalisation for stock
+    ing_scraper.get_market_cap('DE0005200000')
 
-# download key financials
-pnl, balance = ing_scraper.get_financials_for_stock('DE000A1EWWW0')
-print(pnl)
-print(balance)
+    # download key financials
+    pnl, balance = ing_scraper.get_financials_for_stock('DE000A1EWWW0')
+    print(pnl)
+    print(balance)
 
 
 # build index
@@ -48,6 +50,3 @@ dax = StockMarketIndex(
     isin='DE0008469008',
     yahoo_ticker='%5EGDAXI'
 )
-
-
-
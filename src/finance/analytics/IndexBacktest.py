@@ -0,0 +1,174 @@
+"""
+Class definition for index backtest engine.
+"""
+import numpy as np
+import pandas as pd
+
+from src.data.PricePanel import PricePanel
+
+
+class IndexBacktest:
+    """Index reconstruction from component prices and market caps
+
+    Component prices are held as one forward filled (components x dates)
+    array. Between two rebalancing dates the index holds fixed quantities, so
+    its level is the weighted sum of price relatives to the last rebalancing
+    date; all periods are evaluated in one pass over the array, and only the
+    weights themselves are computed per rebalancing date.
+
+    Market caps are only known as of today. The number of shares is assumed
+    constant, so a component's historical market cap is today's scaled by its
+    price relative to the latest one, as in IndexFundamentals.
+    """
+    schemes = ['cap', 'equal', 'capped']
+    # pandas period aliases of the rebalancing frequencies, None holds the initial weights
+    rebalances = {None: 'none', 'W': 'weekly', 'M': 'monthly', 'Q': 'quarterly', 'Y': 'yearly'}
+
+    def __init__(self, prices, market_caps, column='Close', periods_per_year=252):
+        """
+        :param prices: PricePanel of the components keyed by isin, or dict of isin -> data frame
+            as returned by YahooDataLoader.fetch
+        :param market_caps: dict of isin -> current market capitalisation
+        :param column: price column the index is computed on, 'Adj Close' gives a total return index
+        :param periods_per_year: bars per year, used to annualise returns and risks
+        """
+        if not isinstance(prices, PricePanel):
+            prices = PricePanel.from_frames(prices, [column])
+        panel = prices.forward_fill()
+
+        self.column = column
+        self.periods_per_year = periods_per_year
+        self.isins = panel.tickers
+        self.dates = panel.dates
+        # dates before a component's first quote stay NaN
+        self.prices = np.where(np.maximum.accumulate(panel.valid, axis=1), panel.values[column], np.nan)
+
+        last = self.prices[:, -1] if len(self.dates) else np.full(len(self.isins), np.nan)
+        caps = np.array([market_caps.get(isin) or np.nan for isin in self.isins], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.shares = caps / last
+
+    def rebalance_rows(self, rebalance):
+        """Return the rows the weights are reset on: the first row with a quote and the first of every period."""
+        quoted = ~np.isnan(self.prices).all(axis=0)
+        if not quoted.any():
+            return np.empty(0, dtype=int)
+
+        start = quoted.argmax()
+        if rebalance is None:
+            return np.array([start])
+
+        periods = self.dates.to_period(rebalance).asi8
+        rows = np.flatnonzero(np.diff(periods) != 0) + 1
+
+        return np.concatenate([[start], rows[rows > start]])
+
+    def weights(self, scheme, rows, cap=0.1):
+        """Return the (rows x components) target weights, zero for components without a quote.
+
+        :param scheme: 'cap', 'equal' or 'capped', which is cap weighting limited to cap per component
+        """
+        prices = self.prices[:, rows].T
+        if scheme == 'capped' and cap is None:
+            raise ValueError('capped weighting needs a cap')
+        if scheme == 'equal':
+            weights = np.where(np.isnan(prices), 0., 1.)
+        elif scheme in ('cap', 'capped'):
+            weights = np.nan_to_num(prices * self.shares)
+        else:
+            raise ValueError('unknown weighting scheme {}'.format(scheme))
+
+        totals = weights.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = np.where(totals > 0, weights / totals, 0.)
+
+        if scheme == 'capped':
+            weights = self.__cap_weights(weights, cap)
+
+        return weights
+
+    @staticmethod
+    def __cap_weights(weights, cap):
+        """Cut weights above cap and hand the excess to the others in proportion to their weights."""
+        # with too few components the cap cannot hold and they are weighted equally instead
+        caps = np.maximum(cap, 1 / np.maximum((weights > 0).sum(axis=1, keepdims=True), 1))
+        capped = np.zeros(weights.shape, dtype=bool)
+
+        for _ in range(weights.shape[1]):
+            over = weights > caps * (1 + 1e-12)
+            if not over.any():
+                break
+
+            capped |= over
+            weights = np.where(capped, caps, weights)
+            free = np.where(capped, 0., weights)
+            excess = 1 - weights.sum(axis=1, keepdims=True)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                weights = weights + np.nan_to_num(excess * free / free.sum(axis=1, keepdims=True))
+
+        return weights
+
+    def run(self, scheme='cap', rebalance='Q', cap=0.1, base=100.):
+        """Return the index levels and the turnover of every rebalancing.
+
+        Levels are a series over all dates, NaN before the first quote. The
+        turnover is the share of the index traded on each rebalancing date.
+        """
+        rows = self.rebalance_rows(rebalance)
+        name = '{scheme} {rebalance}'.format(scheme=scheme, rebalance=self.rebalances[rebalance])
+        if not len(rows):
+            return pd.Series(np.nan, index=self.dates, name=name), pd.Series(dtype=float, name=name)
+
+        weights = self.weights(scheme, rows, cap)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # price relatives of every date to the rebalancing date of its period
+            period = np.maximum(np.searchsorted(rows, np.arange(len(self.dates)), side='right') - 1, 0)
+            relatives = np.nan_to_num(self.prices / self.prices[:, rows[period]])
+            growth = np.einsum('ti,it->t', weights[period], relatives)
+
+            # the holdings of each period have drifted by its end, which the next weights replace
+            ends = rows[1:]
+            drifted = weights[:-1] * np.nan_to_num(self.prices[:, ends] / self.prices[:, rows[:-1]]).T
+            end_growth = drifted.sum(axis=1)
+            drifted = np.nan_to_num(drifted / end_growth[:, None])
+
+        period_levels = base * np.concatenate([[1.], np.cumprod(end_growth)])
+        levels = period_levels[period] * growth
+        levels[:rows[0]] = np.nan
+        turnover = np.abs(weights[1:] - drifted).sum(axis=1) / 2
+
+        return pd.Series(levels, index=self.dates, name=name), pd.Series(turnover, index=self.dates[ends], name=name)
+
+    def grid(self, schemes=None, rebalances=None, cap=0.1, benchmark=None):
+        """Run every combination of schemes and rebalancing frequencies.
+
+        Returns a (dates x runs) frame of index levels and a summary frame with
+        the annualised return, volatility and turnover of every run, plus its
+        tracking error if a benchmark series of index levels is given.
+        """
+        levels = dict()
+        summary = dict()
+        for scheme in schemes or self.schemes:
+            for rebalance in rebalances or list(self.rebalances):
+                run_levels, turnover = self.run(scheme, rebalance, cap)
+                levels[run_levels.name] = run_levels
+
+                returns = run_levels.dropna().pct_change().dropna()
+                years = len(returns) / self.periods_per_year
+                summary[run_levels.name] = {
+                    'return': (1 + returns).prod() ** (1 / years) - 1 if years else np.nan,
+                    'volatility': returns.std() * np.sqrt(self.periods_per_year),
+                    'turnover': turnover.sum() / years if years else np.nan,
+                    'tracking_error': np.nan if benchmark is None else self.tracking_error(run_levels, benchmark)
+                }
+
+        return pd.DataFrame(levels, index=self.dates), pd.DataFrame.from_dict(summary, orient='index')
+
+    def tracking_error(self, levels, benchmark):
+        """Return the annualised standard deviation of the return difference to benchmark on common dates."""
+        both = pd.concat([levels, benchmark], axis=1, join='inner').dropna()
+        returns = both.pct_change().dropna()
+        if len(returns) < 2:
+            return np.nan
+
+        return (returns.iloc[:, 0] - returns.iloc[:, 1]).std() * np.sqrt(self.periods_per_year)
@@ -0,0 +1,81 @@
+"""
+Class definition for index fundamentals engine.
+"""
+import numpy as np
+import pandas as pd
+
+
+class IndexFundamentals:
+    """Cap-weighted index fundamentals from component financials and market caps
+
+    Component data is held in aligned (components x years) matrices, so the
+    index aggregates are computed with array operations over all members at once.
+    Missing statements are NaN and drop out of both numerator and denominator
+    of every ratio for the year concerned.
+    """
+    fields = ['turnover', 'ebit', 'income', 'current_assets', 'capital_assets', 'equity', 'liabilities']
+
+    def __init__(self, financials, market_caps):
+        """
+        :param financials: dict of isin -> (pnl, balance) as returned by IngDataScraper
+        :param market_caps: dict of isin -> current market capitalisation
+        """
+        self.isins = sorted(isin for isin in financials if market_caps.get(isin) is not None)
+        statements = [self.__merge_statements(*financials[isin]) for isin in self.isins]
+
+        self.years = np.array(sorted(set().union(*[frame.index for frame in statements])), dtype=int)
+        self.market_caps = np.array([market_caps[isin] for isin in self.isins], dtype=float)
+        self.matrices = {
+            field: np.vstack([
+                frame[field].reindex(self.years).to_numpy(dtype=float) for frame in statements
+            ]) if statements else np.empty((0, len(self.years)))
+            for field in self.fields
+        }
+
+    @staticmethod
+    def __merge_statements(pnl, balance):
+        return pnl.set_index('year').join(balance.set_index('year'), how='outer')
+
+    def weights(self):
+        return pd.Series(self.market_caps / self.market_caps.sum(), index=self.isins)
+
+    def summary(self, index_levels=None):
+        """Return index-level market cap, book value, earnings, P/E and P/B per year.
+
+        Market caps are only known as of today. If a series of index levels is
+        given, each year's market cap is scaled by the index level at the end of
+        that year relative to the latest level.
+        """
+        equity = self.matrices['equity']
+        income = self.matrices['income']
+
+        caps = np.broadcast_to(self.market_caps[:, None], equity.shape)
+        if index_levels is not None:
+            caps = caps * self.__level_ratios(index_levels)[None, :]
+
+        book_value = np.nansum(equity, axis=0)
+        earnings = np.nansum(income, axis=0)
+        book_cap = np.where(np.isnan(equity), 0., caps).sum(axis=0)
+        earnings_cap = np.where(np.isnan(income), 0., caps).sum(axis=0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pe = np.where(earnings > 0, earnings_cap / earnings, np.nan)
+            pb = np.where(book_value > 0, book_cap / book_value, np.nan)
+
+        return pd.DataFrame(
+            {
+                'market_cap': caps.sum(axis=0),
+                'book_value': book_value,
+                'earnings': earnings,
+                'pe': pe,
+                'pb': pb
+            },
+            index=pd.Index(self.years, name='year')
+        )
+
+    def __level_ratios(self, index_levels):
+        index_levels = index_levels.dropna()
+        year_end_levels = index_levels.groupby(index_levels.index.year).last()
+        ratios = year_end_levels.reindex(self.years).to_numpy(dtype=float) / index_levels.iloc[-1]
+
+        return ratios
@@ -0,0 +1,202 @@
+"""
+Class definition for rolling analytics engine.
+"""
+import copy
+import numpy as np
+import pandas as pd
+
+from src.data.PricePanel import PricePanel
+
+
+class RollingAnalytics:
+    """Rolling analytics over a (dates x tickers) panel of prices
+
+    Prices of all tickers are aligned on one date axis and forward filled, so
+    every ticker's history is a contiguous run of valid rows from its first
+    quote on. The engine keeps running sums of prices, returns and squared
+    returns plus the running peak of every ticker. Each rolling statistic is
+    then the difference of two rows of these sums, computed for all tickers
+    and dates at once, and appending new bars extends the sums in O(new bars).
+    """
+    __initial_capacity = 64
+
+    def __init__(self, frames, column='Adj Close', periods_per_year=252):
+        """
+        :param frames: PricePanel, or dict of ticker -> data frame as returned by YahooDataLoader.fetch
+        :param column: price column the analytics are computed on
+        :param periods_per_year: bars per year, used to annualise volatilities
+        """
+        self.column = column
+        self.periods_per_year = periods_per_year
+        self.tickers = frames.tickers if isinstance(frames, PricePanel) else list(frames)
+
+        n = len(self.tickers)
+        self.__size = 0
+        self.__dates = np.empty(0, dtype='datetime64[ns]')
+        self.__prices = np.empty((0, n))
+        self.__peaks = np.empty((0, n))
+        # running sums have a leading row of zeros, so a window sum is sums[end] - sums[start]
+        self.__price_sums = np.zeros((1, n))
+        self.__return_sums = np.zeros((1, n))
+        self.__square_sums = np.zeros((1, n))
+        # row of each ticker's first quote, past the end while it has none
+        # (half the int64 range, so adding a lag cannot overflow)
+        self.__first = np.full(n, np.iinfo(np.int64).max // 2)
+
+        self.append(frames)
+
+    def __len__(self):
+        return self.__size
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    @property
+    def dates(self):
+        return pd.DatetimeIndex(self.__dates[:self.__size], name='Date')
+
+    def __reserve(self, rows):
+        needed = self.__size + rows
+        if needed <= len(self.__dates):
+            return
+
+        capacity = max(needed, 2 * len(self.__dates), self.__initial_capacity)
+
+        def _grow(array, extra=0):
+            grown = np.empty((capacity + extra,) + array.shape[1:], dtype=array.dtype)
+            grown[:len(array)] = array
+            return grown
+
+        self.__dates = _grow(self.__dates)
+        self.__prices = _grow(self.__prices)
+        self.__peaks = _grow(self.__peaks)
+        self.__price_sums = _grow(self.__price_sums, 1)
+        self.__return_sums = _grow(self.__return_sums, 1)
+        self.__square_sums = _grow(self.__square_sums, 1)
+
+    def __align(self, frames):
+        """Return the dates after the last one held and a (dates x tickers) array of their prices."""
+        after = self.__dates[self.__size - 1] + np.timedelta64(1, 'ns') if self.__size else None
+        if isinstance(frames, PricePanel):
+            panel = frames.slice(start=after)
+        else:
+            panel = PricePanel.from_frames(frames, [self.column], start=after)
+
+        values = np.full((len(panel), len(self.tickers)), np.nan)
+        for position, ticker in enumerate(self.tickers):
+            if ticker in panel:
+                values[:, position] = panel.values[self.column][panel.position(ticker)]
+
+        return panel.dates.to_numpy(dtype='datetime64[ns]'), values
+
+    @staticmethod
+    def __forward_fill(values):
+        filled_rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+        np.maximum.accumulate(filled_rows, axis=0, out=filled_rows)
+
+        return values[filled_rows, np.arange(values.shape[1])]
+
+    def append(self, frames):
+        """Add the bars of frames dated after the last date held; returns the number of new dates.
+
+        Tickers are fixed when the engine is created, bars of other tickers are ignored.
+        """
+        dates, values = self.__align(frames)
+        k = len(dates)
+        if not k:
+            return 0
+
+        self.__reserve(k)
+        size, n = self.__size, len(self.tickers)
+        previous_prices = self.__prices[size - 1] if size else np.full(n, np.nan)
+        previous_peaks = self.__peaks[size - 1] if size else np.full(n, np.nan)
+
+        # dates a ticker has no bar on carry its last price
+        prices = self.__forward_fill(np.vstack([previous_prices, values]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.nan_to_num(prices[1:] / prices[:-1] - 1)
+        prices = prices[1:]
+
+        rows = slice(size, size + k)
+        sums = slice(size + 1, size + k + 1)
+        self.__dates[rows] = dates
+        self.__prices[rows] = prices
+        self.__peaks[rows] = np.fmax.accumulate(np.vstack([previous_peaks, prices]), axis=0)[1:]
+        self.__price_sums[sums] = self.__price_sums[size] + np.nan_to_num(prices).cumsum(axis=0)
+        self.__return_sums[sums] = self.__return_sums[size] + returns.cumsum(axis=0)
+        self.__square_sums[sums] = self.__square_sums[size] + (returns ** 2).cumsum(axis=0)
+
+        quoted = ~np.isnan(prices)
+        starting = (self.__first > size + k) & quoted.any(axis=0)
+        self.__first[starting] = size + quoted[:, starting].argmax(axis=0)
+
+        self.__size += k
+        return k
+
+    def __frame(self, values):
+        return pd.DataFrame(values, index=self.dates, columns=self.tickers)
+
+    def __rolling_sum(self, sums, window):
+        ends = np.arange(1, self.__size + 1)
+        return sums[ends] - sums[np.maximum(ends - window, 0)]
+
+    def __full_windows(self, window, lag=0):
+        # a window is complete once it starts at or after the ticker's first quote (plus lag for returns)
+        starts = np.arange(self.__size)[:, None] - window + 1
+        return starts >= self.__first[None, :] + lag
+
+    def prices(self):
+        return self.__frame(self.__prices[:self.__size])
+
+    def returns(self):
+        prices = self.__prices[:self.__size]
+        returns = np.full_like(prices, np.nan)
+        returns[1:] = prices[1:] / prices[:-1] - 1
+
+        return self.__frame(returns)
+
+    def cumulative_returns(self):
+        """Return the performance of every ticker since its first quote."""
+        prices = self.__prices[:self.__size]
+        if not self.__size:
+            return self.__frame(prices)
+        base = prices[np.minimum(self.__first, self.__size - 1), np.arange(len(self.tickers))]
+
+        return self.__frame(prices / base - 1)
+
+    def moving_average(self, window):
+        averages = self.__rolling_sum(self.__price_sums, window) / window
+        averages[~self.__full_windows(window)] = np.nan
+
+        return self.__frame(averages)
+
+    def volatility(self, window=21):
+        """Return the annualised standard deviation of returns over the last window bars."""
+        sums = self.__rolling_sum(self.__return_sums, window)
+        squares = self.__rolling_sum(self.__square_sums, window)
+        variance = np.maximum(squares - sums ** 2 / window, 0) / (window - 1)
+        volatility = np.sqrt(variance * self.periods_per_year)
+        volatility[~self.__full_windows(window, lag=1)] = np.nan
+
+        return self.__frame(volatility)
+
+    def drawdown(self):
+        """Return the relative distance of every price to its running peak."""
+        return self.__frame(self.__prices[:self.__size] / self.__peaks[:self.__size] - 1)
+
+    def correlation(self, window=63):
+        """Return the correlation matrix of returns over the last window bars.
+
+        Tickers without a full window of returns get NaN correlations.
+        """
+        if self.__size < 2:
+            return pd.DataFrame(np.nan, index=self.tickers, columns=self.tickers)
+
+        prices = self.__prices[max(self.__size - window - 1, 0):self.__size]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = prices[1:] / prices[:-1] - 1
+            deviations = returns - returns.mean(axis=0)
+            norms = np.sqrt((deviations ** 2).sum(axis=0))
+            correlation = deviations.T @ deviations / np.outer(norms, norms)
+
+        return pd.DataFrame(correlation, index=self.tickers, columns=self.tickers)
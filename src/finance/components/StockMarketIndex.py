@@ -1,20 +1,55 @@
 """
 Class definition for stock market index.
 """
+import datetime as dt
+import logging
+
 from src.data.YahooDataLoader import YahooDataLoader
-from src.data.IngDataScraper import IngDataScraper
+
+logger = logging.getLogger(__name__)
 
 
 class StockMarketIndex:
     """Stock market index implementation"""
 
-    def __init__(self, isin, yahoo_ticker):
+    def __init__(self, isin, yahoo_ticker, ing_scraper=None, yahoo_loader=None, fundamentals_store=None,
+                 fundamentals_max_age=dt.timedelta(days=30)):
+        """
+        :param fundamentals_store: FundamentalsStore that serves recent enough component
+            financials without scraping and keeps the ones that had to be scraped
+        """
         self.isin = isin
         self.yahoo_ticker = yahoo_ticker
-        self.components = {}
+        self.fundamentals_store = fundamentals_store
+        self.fundamentals_max_age = fundamentals_max_age
+        self.__components = {}
+        self.__fundamentals = None
+
+        self.__ing_scraper = ing_scraper
+        self.__yahoo_loader = yahoo_loader
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def ing_scraper(self):
+        # the scraper pulls in selenium and drives a browser, so it is only
+        # created once component or fundamental data is requested
+        if self.__ing_scraper is None:
+            from src.data.IngDataScraper import IngDataScraper
+            self.__ing_scraper = IngDataScraper()
 
-        self.ing_scraper = IngDataScraper()
-        self.yahoo_loader = YahooDataLoader()
+        return self.__ing_scraper
+
+    @property
+    def yahoo_loader(self):
+        if self.__yahoo_loader is None:
+            self.__yahoo_loader = YahooDataLoader()
+
+        return self.__yahoo_loader
 
     def data(self, start, end, freq):
         return self.yahoo_loader.fetch(
@@ -24,19 +59,89 @@ class StockMarketIndex:
             freq=freq
         )
 
-    def components(self):
-        if not self.components:
-            components = self.ing_scraper.get_components(self.isin)
-            self.components = {isin: details[0] for isin, details in components.items()}
+    def components(self, refresh=False):
+        if refresh or not self.__components:
+            components = self.ing_scraper.get_components(self.isin, refresh=refresh)
+            if components is None:
+                raise RuntimeError('no components page for {}'.format(self.isin))
+            self.__components = {isin: details[0] for isin, details in components.items()}
 
-        return self.components
+        return self.__components
 
-    def book_value(self):
-        components = self.components()
-        balances = dict()
+    def fundamentals(self, scrape=True):
+        """Return the IndexFundamentals of the components.
+
+        Components without a usable profile page are left out. With
+        scrape=False only the fundamentals store is asked, so no profile page
+        is loaded, and the partial result is not kept.
+        """
+        if self.__fundamentals is None:
+            from src.finance.analytics.IndexFundamentals import IndexFundamentals
+
+            isins = list(self.components())
+            financials = dict()
+            market_caps = dict()
+            if self.fundamentals_store is not None:
+                financials, market_caps = self.fundamentals_store.financials(
+                    isins,
+                    since=dt.date.today() - self.fundamentals_max_age
+                )
+            if not scrape:
+                return IndexFundamentals(financials, market_caps)
 
-        for cisin in components.keys():
-            _, cbalance = self.ing_scraper.get_financials_for_stock(cisin)
-            balances[cisin] = cbalance
+            profiles = list()
+            for cisin, profile, error in self.ing_scraper.get_profiles(
+                [isin for isin in isins if isin not in financials]
+            ):
+                if profile is not None:
+                    # a component whose page lacks a table or holds an unparsable figure is left out
+                    try:
+                        pnl, balance, market_cap = profile.pnl(), profile.balance(), profile.market_cap()
+                    except ValueError as parse_error:
+                        error = parse_error
+                    else:
+                        financials[cisin] = pnl, balance
+                        market_caps[cisin] = market_cap
+                        profiles.append(profile)
+                if error is not None:
+                    logger.warning('skipped %s: %s', cisin, error)
+            if self.fundamentals_store is not None:
+                self.fundamentals_store.put_profiles(profiles)
+
+            self.__fundamentals = IndexFundamentals(financials, market_caps)
+
+        return self.__fundamentals
+
+    def backtest(self, start, end, freq, ticker_map, column='Close', periods_per_year=252):
+        """Return an IndexBacktest of the components with a Yahoo ticker in ticker_map, or None if there are none.
+
+        Market caps are taken from the stored fundamentals only, so no profile
+        page is loaded, and components without stored financials only enter
+        the equal weighted runs.
+        """
+        from src.finance.analytics.IndexBacktest import IndexBacktest
+
+        if not ticker_map:
+            return None
+        tickers = {ticker_map[isin]: isin for isin in self.components() if isin in ticker_map}
+        if not tickers:
+            return None
+
+        frames, _ = self.yahoo_loader.fetch_many(list(tickers), start, end, freq)
+        fundamentals = self.fundamentals(scrape=False)
+
+        return IndexBacktest(
+            {tickers[ticker]: frame for ticker, frame in frames.items()},
+            dict(zip(fundamentals.isins, fundamentals.market_caps)),
+            column=column,
+            periods_per_year=periods_per_year
+        )
+
+    def book_value(self):
+        return self.fundamentals().summary()['book_value']
 
-        # ToDo: determine weights
+    def close(self):
+        if self.__ing_scraper is not None:
+            self.__ing_scraper.close()
+        if self.__yahoo_loader is not None:
+            self.__yahoo_loader.close()
@@ -0,0 +1,49 @@
+"""
+Class definition for server-side figure cache.
+"""
+from collections import OrderedDict
+import threading
+
+from src.monitoring.Metrics import metrics
+
+
+class FigureCache:
+    """In-memory LRU cache for rendered figures, bounded by entry count and memory"""
+
+    def __init__(self, max_entries=32, max_bytes=256 * 2**20, name='figures'):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.__entries = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        with self.__lock:
+            if key not in self.__entries:
+                metrics.inc('cache_misses', cache=self.name)
+                return None
+            metrics.inc('cache_hits', cache=self.name)
+            self.__entries.move_to_end(key)
+            return self.__entries[key][0]
+
+    def put(self, key, value, size):
+        """Store value under key, evicting least recently used entries beyond the bounds."""
+        if size > self.max_bytes:
+            return
+
+        with self.__lock:
+            if key in self.__entries:
+                self.__size -= self.__entries.pop(key)[1]
+            self.__entries[key] = (value, size)
+            self.__size += size
+
+            while len(self.__entries) > self.max_entries or self.__size > self.max_bytes:
+                _, (_, evicted_size) = self.__entries.popitem(last=False)
+                self.__size -= evicted_size
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
@@ -0,0 +1,77 @@
+"""
+Class definition for disk-backed job queue.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import datetime as dt
+import json
+import os
+import shutil
+import uuid
+
+
+class JobQueue:
+    """Disk-backed queue of background jobs with incremental progress
+
+    Jobs run on a local thread pool, while their state, i.e. the keys done
+    and failed so far, is written to disk. Any process sharing the directory
+    can therefore poll a job, which makes the queue a local stand-in for a
+    broker. Results themselves go to the shared stores the jobs write to.
+    """
+    __state_file = 'state.json'
+
+    def __init__(self, path='data/jobs', max_workers=4, max_age=dt.timedelta(hours=1)):
+        self.path = path
+        self.max_age = max_age
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        os.makedirs(self.path, exist_ok=True)
+
+    def __dir(self, job_id):
+        return os.path.join(self.path, job_id)
+
+    def __write_state(self, job_id, state):
+        path = os.path.join(self.__dir(job_id), self.__state_file)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+
+    def submit(self, total, fn, *args):
+        """Start fn(job_id, *args) in the background and return the new job id."""
+        self.purge()
+
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.__dir(job_id))
+        self.__write_state(job_id, {'total': total, 'done': [], 'errors': {}, 'finished': False})
+        self.executor.submit(contextvars.copy_context().run, self.__run, job_id, fn, *args)
+
+        return job_id
+
+    def __run(self, job_id, fn, *args):
+        try:
+            fn(job_id, *args)
+        finally:
+            state = self.status(job_id)
+            state['finished'] = True
+            self.__write_state(job_id, state)
+
+    def mark_done(self, job_id, key):
+        state = self.status(job_id)
+        state['done'].append(key)
+        self.__write_state(job_id, state)
+
+    def put_error(self, job_id, key, message):
+        state = self.status(job_id)
+        state['errors'][key] = message
+        self.__write_state(job_id, state)
+
+    def status(self, job_id):
+        with open(os.path.join(self.__dir(job_id), self.__state_file)) as f:
+            return json.load(f)
+
+    def purge(self):
+        """Remove jobs older than max_age."""
+        oldest = (dt.datetime.now() - self.max_age).timestamp()
+        for job_id in os.listdir(self.path):
+            job_dir = self.__dir(job_id)
+            if os.path.getmtime(job_dir) < oldest:
+                shutil.rmtree(job_dir, ignore_errors=True)
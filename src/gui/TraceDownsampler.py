@@ -0,0 +1,41 @@
+"""
+Class definition for trace downsampler.
+"""
+import numpy as np
+
+
+class TraceDownsampler:
+    """Min/max bucket downsampling of plot traces
+
+    The series is cut into equally sized buckets and only the lowest and the
+    highest point of every bucket is kept, which preserves the visual envelope
+    of the line (spikes and drawdowns) at a bounded number of points.
+    """
+
+    def __init__(self, max_points=2000):
+        self.max_points = max_points
+
+    def indices(self, values):
+        """Return the sorted positions of the points to keep."""
+        values = np.asarray(values, dtype=float)
+        n = len(values)
+        if n <= self.max_points:
+            return np.arange(n)
+
+        n_buckets = max(self.max_points // 2 - 1, 1)
+        bucket_size = -(-n // n_buckets)
+        padded = np.full(n_buckets * bucket_size, np.nan)
+        padded[:n] = values
+        buckets = padded.reshape(n_buckets, bucket_size)
+
+        nan = np.isnan(buckets)
+        offsets = np.arange(n_buckets) * bucket_size
+        lows = np.where(nan, np.inf, buckets).argmin(axis=1) + offsets
+        highs = np.where(nan, -np.inf, buckets).argmax(axis=1) + offsets
+
+        keep = np.concatenate([[0, n - 1], lows, highs])
+        return np.unique(keep[keep < n])
+
+    def __call__(self, series):
+        """Downsample a pandas series, keeping its index as the x values."""
+        return series.iloc[self.indices(series.to_numpy())]
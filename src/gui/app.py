@@ -4,12 +4,33 @@ Application for visualisation
 import datetime as dt
 from dateutil.relativedelta import relativedelta
 import dash
+import flask
 from dash.dependencies import Input, Output, State
 import dash_html_components as html
 import dash_core_components as dcc
 import dash_bootstrap_components as dbc
+import os
+import pandas as pd
+import sys
+import time
+import uuid
 
+from src.data.EndOfDayUpdater import EndOfDayUpdater
+from src.data.FundamentalsStore import FundamentalsStore
+from src.data.IngDataScraper import IngDataScraper
+from src.data.PageCache import PageCache
+from src.data.PricePanel import PricePanel
+from src.data.QuotePanel import QuotePanel
+from src.data.QuoteStore import QuoteStore
+from src.data.SqliteCacheBackend import SqliteCacheBackend
 from src.data.YahooDataLoader import YahooDataLoader
+from src.finance.analytics.IndexBacktest import IndexBacktest
+from src.finance.analytics.RollingAnalytics import RollingAnalytics
+from src.finance.components.StockMarketIndex import StockMarketIndex
+from src.gui.FigureCache import FigureCache
+from src.gui.JobQueue import JobQueue
+from src.gui.TraceDownsampler import TraceDownsampler
+from src.monitoring.Metrics import metrics
 
 # data setup
 default_index_tickers = [
@@ -26,12 +47,62 @@ default_commodity_tickers = [
     'GC%3DF',       # gold
 ]
 
+index_isins = {
+    '%5EGDAXI': 'DE0008469008',
+    '%5EMDAXI': 'DE0008467416',
+    '%5ESDAXI': 'DE0009653386',
+    '%5EDJI': 'US2605661048',
+    '%5EGSPC': 'US78378X1072',
+    '%5ESTOXX50E': 'EU0009658145',
+    '%5EN225': 'JP9010C00002',
+}
+
+# yahoo tickers of index components, a CSV file with the columns isin and ticker
+component_tickers_path = os.path.join('data', 'component_tickers.csv')
+component_tickers = EndOfDayUpdater.read_ticker_map(component_tickers_path) \
+    if os.path.exists(component_tickers_path) else dict()
+
+quote_store = QuoteStore()
+# responses fetched by any worker, batch job or notebook on the host are hits for all others
+cache_backend = SqliteCacheBackend()
+yahoo_loader = YahooDataLoader(store=quote_store, cache=cache_backend)
+ing_scraper = IngDataScraper(cache=PageCache(backend=cache_backend))
+fundamentals_store = FundamentalsStore()
+stock_market_indices = dict()
+# bars shown on the dashboard are shared by all worker processes instead of being held by each
+quote_panels = {freq: QuotePanel(os.path.join('data', 'panel', freq), freq=freq) for freq in ('1d', '1wk', '1mo')}
+figure_cache = FigureCache()
+analytics_cache = FigureCache(max_entries=16, name='analytics')
+backtest_cache = FigureCache(max_entries=8, name='backtest')
+trace_downsampler = TraceDownsampler()
+render_jobs = JobQueue()
+
 # global parameters
 date_format_display = 'DD.MM.YYYY'
 date_format_internal = '%Y-%m-%d'
 
 margin_style = {'l': 50, 'r': 50, 't': 80, 'b': 20}
 
+render_interval = 500   # milliseconds between progress polls
+render_timeout = 60     # seconds until outstanding tickers are given up
+render_batch_interval = 1   # seconds of downloaded bars published to the quote panel at once
+fundamentals_interval = 5000    # milliseconds between polls of the fundamentals scrape
+panel_refresh_interval = 3600   # seconds between refreshes of the shared quote panels
+
+# bars per year and window lengths of the rolling analytics per frequency
+analytics_windows = {
+    '1d': {'periods_per_year': 252, 'moving_average': 200, 'volatility': 21, 'correlation': 63},
+    '1wk': {'periods_per_year': 52, 'moving_average': 40, 'volatility': 13, 'correlation': 26},
+    '1mo': {'periods_per_year': 12, 'moving_average': 10, 'volatility': 12, 'correlation': 24}
+}
+analytics_graphs = [
+    'grph-cumulative-returns',
+    'grph-moving-averages',
+    'grph-volatility',
+    'grph-drawdowns',
+    'grph-correlation'
+]
+
 # initialise arguments
 init_start_date = dt.date.today() - relativedelta(years=1)
 init_end_date = dt.date.today()-dt.timedelta(days=1)
@@ -83,6 +154,18 @@ app.layout = html.Div(
                                     id='btn-run',
                                     children='Run'
                                 ),
+                                html.Br(),
+                                html.Br(),
+                                dbc.Progress(
+                                    id='prg-render-job',
+                                    value=0
+                                ),
+                                dcc.Store(id='str-render-job'),
+                                dcc.Interval(
+                                    id='itv-render-job',
+                                    interval=render_interval,
+                                    disabled=True
+                                ),
                                 html.Hr(),
                                 html.Span(
                                     [
@@ -119,6 +202,41 @@ app.layout = html.Div(
                                         'height': '12rem',
                                         'width': '12rem'
                                     }
+                                ),
+                                html.Hr(),
+                                html.P('Index backtest:'),
+                                dcc.Dropdown(
+                                    id='drp-backtest-index',
+                                    options=[{'label': ticker, 'value': ticker} for ticker in index_isins],
+                                    value=default_index_tickers[0],
+                                    style={
+                                        'width': '12rem'
+                                    }
+                                ),
+                                html.Br(),
+                                html.P('Rebalancing:'),
+                                dcc.Checklist(
+                                    id='chk-backtest-rebalance',
+                                    options=[{'label': label, 'value': label} for label in IndexBacktest.rebalances.values()],
+                                    value=['none', 'quarterly'],
+                                    inputStyle={
+                                        'margin-left': '5px',
+                                        'margin-right': '5px'
+                                    }
+                                ),
+                                html.P('Weight cap [%]:'),
+                                dcc.Input(
+                                    id='inp-backtest-cap',
+                                    type='number',
+                                    min=1,
+                                    max=100,
+                                    value=10
+                                ),
+                                html.Br(),
+                                html.Br(),
+                                html.Button(
+                                    id='btn-backtest',
+                                    children='Backtest'
                                 )
                             ],
                             style={
@@ -139,7 +257,11 @@ app.layout = html.Div(
                                 dbc.Col(
                                     sm=12,
                                     xl=6,
-                                    children=[dcc.Graph(id='grph-index-values')]
+                                    children=[
+                                        dcc.Store(id='str-figure-key'),
+                                        dcc.Store(id='str-index-values'),
+                                        dcc.Graph(id='grph-index-values')
+                                    ]
                                 ),
                                 # stock index volume
                                 dbc.Col(
@@ -155,7 +277,15 @@ app.layout = html.Div(
                                 dbc.Col(
                                     sm=12,
                                     xl=6,
-                                    children=[dcc.Graph(id='grph-pe-pb')]
+                                    children=[
+                                        dcc.Store(id='str-fundamentals-job'),
+                                        dcc.Interval(
+                                            id='itv-fundamentals-job',
+                                            interval=fundamentals_interval,
+                                            disabled=True
+                                        ),
+                                        dcc.Graph(id='grph-pe-pb')
+                                    ]
                                 ),
                                 # commodity prices
                                 dbc.Col(
@@ -164,6 +294,54 @@ app.layout = html.Div(
                                     children=[dcc.Graph(id='grph-commodity-prices')]
                                 )
                             ]
+                        ),
+                        dbc.Row(
+                            children=[
+                                # performance since the start of the period
+                                dbc.Col(
+                                    sm=12,
+                                    xl=6,
+                                    children=[dcc.Graph(id='grph-cumulative-returns')]
+                                ),
+                                # distance to the moving average
+                                dbc.Col(
+                                    sm=12,
+                                    xl=6,
+                                    children=[dcc.Graph(id='grph-moving-averages')]
+                                )
+                            ]
+                        ),
+                        dbc.Row(
+                            children=[
+                                # rolling volatility
+                                dbc.Col(
+                                    sm=12,
+                                    xl=6,
+                                    children=[dcc.Graph(id='grph-volatility')]
+                                ),
+                                # drawdowns
+                                dbc.Col(
+                                    sm=12,
+                                    xl=6,
+                                    children=[dcc.Graph(id='grph-drawdowns')]
+                                )
+                            ]
+                        ),
+                        dbc.Row(
+                            children=[
+                                # return correlation
+                                dbc.Col(
+                                    sm=12,
+                                    xl=6,
+                                    children=[dcc.Graph(id='grph-correlation')]
+                                ),
+                                # index reconstructions against the benchmark
+                                dbc.Col(
+                                    sm=12,
+                                    xl=6,
+                                    children=[dcc.Graph(id='grph-index-backtest')]
+                                )
+                            ]
                         )
                     ]
                 )
@@ -172,12 +350,230 @@ app.layout = html.Div(
     ]
 )
 
+def figure_cache_key(figure_key):
+    return (
+        tuple(figure_key['index_tickers']),
+        tuple(figure_key['commodity_tickers']),
+        figure_key['start'],
+        figure_key['end'],
+        figure_key['freq']
+    )
+
+
+def figure_period(figure_key):
+    return (
+        dt.datetime.strptime(figure_key['start'], date_format_internal),
+        dt.datetime.strptime(figure_key['end'], date_format_internal)
+    )
+
+
+def figure_tickers(figure_key):
+    return list(dict.fromkeys(figure_key['index_tickers'] + figure_key['commodity_tickers']))
+
+
+def missing_tickers(figure_key):
+    """Return the tickers of figure_key that the shared quote panel does not cover yet."""
+    panel = quote_panels[figure_key['freq']]
+    start, end = figure_period(figure_key)
+
+    return [ticker for ticker in figure_tickers(figure_key) if not panel.covers(ticker, start, end)]
+
+
+def load_price_panel(figure_key, tickers=None):
+    """Align the bars of the figure's tickers, or of those among tickers, on one date axis."""
+    start, end = figure_period(figure_key)
+    tickers = [ticker for ticker in figure_tickers(figure_key) if tickers is None or ticker in tickers]
+
+    return PricePanel.from_frames(quote_panels[figure_key['freq']].frames(tickers, start, end))
+
+
+def load_ticker_data(figure_key):
+    panel = quote_panels[figure_key['freq']]
+    start, end = figure_period(figure_key)
+
+    # failed tickers are left out of the figures instead of breaking the callback
+    results, errors = yahoo_loader.fetch_many(missing_tickers(figure_key), start, end, figure_key['freq'])
+    panel.update((ticker, start, end, data) for ticker, data in results.items())
+
+    return load_price_panel(figure_key), errors
+
+
+def relayout_x_range(relayout_data):
+    if not relayout_data:
+        return None
+    if 'xaxis.range[0]' in relayout_data:
+        return relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'])
+    return None
+
+
+def build_figure(title, tickers, column, price_panel, x_range=None):
+    traces = list()
+
+    with metrics.timer('stage', stage='figure_build', figure=title):
+        if x_range is not None:
+            price_panel = price_panel.slice(x_range[0], x_range[1])
+
+        for ticker in tickers:
+            if ticker not in price_panel:
+                continue
+
+            series = trace_downsampler(price_panel.series(ticker, column))
+
+            traces.append({
+                'x': series.index,
+                'y': series,
+                'type': 'scatter',
+                'name': ticker
+            })
+
+    return {
+        'data': traces,
+        'layout': {
+            'title': title,
+            'showlegend': True,
+            'margin': margin_style,
+            # keeps the user's zoom when the traces are swapped for a finer resolution
+            'uirevision': title
+        }
+    }
+
+
+def fetch_job(job_id, figure_key):
+    panel = quote_panels[figure_key['freq']]
+    start, end = figure_period(figure_key)
+    missing = missing_tickers(figure_key)
+
+    # the bars themselves go to the shared quote panel, the job only records which tickers are ready
+    for ticker in figure_tickers(figure_key):
+        if ticker not in missing:
+            render_jobs.mark_done(job_id, ticker)
+
+    # every panel update rewrites all tickers into a new generation, so downloads are published in batches
+    entries = list()
+    published = time.monotonic()
+    for ticker, data, error in yahoo_loader.iter_fetch(
+        missing, start, end, figure_key['freq'], timeout=render_timeout
+    ):
+        if error is None:
+            entries.append((ticker, start, end, data))
+        else:
+            render_jobs.put_error(job_id, ticker, str(error))
+
+        if entries and time.monotonic() - published >= render_batch_interval:
+            publish_entries(job_id, panel, entries)
+            entries = list()
+            published = time.monotonic()
+
+    publish_entries(job_id, panel, entries)
+
+
+def publish_entries(job_id, panel, entries):
+    panel.update(entries)
+    for ticker, _, _, _ in entries:
+        render_jobs.mark_done(job_id, ticker)
+
+
+def build_figures(figure_key, price_panel):
+    return (
+        build_figure('Index Values', figure_key['index_tickers'], 'Close', price_panel),
+        build_figure('Index Volume', figure_key['index_tickers'], 'Volume', price_panel),
+        build_figure('Commodity Prices', figure_key['commodity_tickers'], 'Close', price_panel)
+    )
+
+
+def load_analytics(figure_key, price_panel):
+    """Return the rolling analytics of price_panel, extending a cached engine by the bars it lacks.
+
+    Cached engines are read by concurrent renders and are therefore never
+    changed; new bars go into a copy, which then replaces the cached one.
+    """
+    key = (tuple(price_panel.tickers), figure_key['freq'], figure_key['start'])
+    analytics = analytics_cache.get(key)
+
+    # an engine cannot drop bars, so a period ending earlier needs a new one
+    if analytics is None or (len(analytics) and analytics.dates[-1] > pd.Timestamp(figure_key['end'])):
+        analytics = RollingAnalytics(
+            price_panel,
+            periods_per_year=analytics_windows[figure_key['freq']]['periods_per_year']
+        )
+    elif len(price_panel) and (not len(analytics) or price_panel.dates[-1] > analytics.dates[-1]):
+        analytics = analytics.copy()
+        analytics.append(price_panel)
+    else:
+        return analytics
+
+    # prices, peaks and the running sums of prices, returns and squared returns
+    analytics_cache.put(key, analytics, size=5 * 8 * len(analytics) * len(analytics.tickers))
+
+    return analytics
+
+
+def build_frame_figure(title, frame, tickformat='.0%'):
+    traces = list()
+
+    with metrics.timer('stage', stage='figure_build', figure=title):
+        for ticker in frame.columns:
+            series = trace_downsampler(frame[ticker].dropna())
+            traces.append({
+                'x': series.index,
+                'y': series,
+                'type': 'scatter',
+                'name': ticker
+            })
+
+    return {
+        'data': traces,
+        'layout': {
+            'title': title,
+            'yaxis': {'tickformat': tickformat},
+            'showlegend': True,
+            'margin': margin_style
+        }
+    }
+
+
+def build_analytics_figures(figure_key, price_panel):
+    windows = analytics_windows[figure_key['freq']]
+    with metrics.timer('stage', stage='analytics'):
+        analytics = load_analytics(figure_key, price_panel)
+        moving_average = analytics.prices() / analytics.moving_average(windows['moving_average']) - 1
+        volatility = analytics.volatility(windows['volatility'])
+        correlation = analytics.correlation(windows['correlation'])
+
+    return (
+        build_frame_figure('Cumulative Returns', analytics.cumulative_returns()),
+        build_frame_figure('Distance to {} Bar Moving Average'.format(windows['moving_average']), moving_average),
+        build_frame_figure('{} Bar Volatility (annualised)'.format(windows['volatility']), volatility),
+        build_frame_figure('Drawdowns', analytics.drawdown()),
+        {
+            'data': [{
+                'z': correlation.to_numpy(),
+                'x': correlation.columns,
+                'y': correlation.index,
+                'type': 'heatmap',
+                'zmin': -1,
+                'zmax': 1,
+                'colorscale': 'RdBu'
+            }],
+            'layout': {
+                'title': 'Return Correlation (last {} bars)'.format(windows['correlation']),
+                'margin': margin_style
+            }
+        }
+    )
+
+
 @app.callback(
     [
-        Output('grph-index-values', 'figure'),
+        Output('str-figure-key', 'data'),
+        Output('str-render-job', 'data'),
+        Output('itv-render-job', 'disabled'),
+        Output('str-index-values', 'data'),
         Output('grph-index-volume', 'figure'),
         Output('grph-commodity-prices', 'figure')
-    ],
+    ] + [Output(graph, 'figure') for graph in analytics_graphs],
     [
         Input('btn-run', 'n_clicks')
     ],
@@ -186,99 +582,392 @@ app.layout = html.Div(
         State('dpr-date-period', 'end_date'),
         State('drp-freq', 'value'),
         State('txtr-index-tickers', 'value'),
-        State('txtr-commodity-tickers', 'value'),
-        State('rd-axis-scaling', 'value')
+        State('txtr-commodity-tickers', 'value')
     ]
 )
-def render_plots(n_clicks, start_date, end_date, freq, index_tickers, commodity_tickers, yaxis_scaling):
+def render_plots(n_clicks, start_date, end_date, freq, index_tickers, commodity_tickers):
     if n_clicks is None:
         raise dash.exceptions.PreventUpdate
     else:
         if (start_date is None) or (end_date is None) or (not index_tickers and not commodity_tickers):
             raise dash.exceptions.PreventUpdate
 
-        index_ticker_list = index_tickers.split('\n')
-        commodity_ticker_list = commodity_tickers.split('\n')
-        value_traces = list()
-        volume_traces = list()
-        commodity_traces = list()
+        figure_key = {
+            'index_tickers': [ticker for ticker in index_tickers.split('\n') if ticker],
+            'commodity_tickers': [ticker for ticker in commodity_tickers.split('\n') if ticker],
+            'start': start_date.split('T')[0],
+            'end': end_date.split('T')[0],
+            'freq': freq
+        }
 
-        ticker_value_yaxis = {'type': yaxis_scaling}
-        if yaxis_scaling == 'linear':
-            ticker_value_yaxis['tickformat'] = ','
+        cached = figure_cache.get(figure_cache_key(figure_key))
+        if cached is not None:
+            return (figure_key, None, True) + cached
 
-        start = dt.datetime.strptime(start_date.split('T')[0], date_format_internal)
-        end = dt.datetime.strptime(end_date.split('T')[0], date_format_internal)
+        # downloads run as a background job, the figures are streamed in by render_progress
+        total = len(set(figure_key['index_tickers'] + figure_key['commodity_tickers']))
+        job_id = render_jobs.submit(total, fetch_job, figure_key)
 
-        dl = YahooDataLoader()
+        return (figure_key, job_id, False) + (dash.no_update,) * (3 + len(analytics_graphs))
 
-        for ticker in index_ticker_list:
-            if not ticker:
-                continue
 
-            ticker_data = dl.fetch(
-                ticker=ticker,
-                start=start,
-                end=end,
-                freq=freq
-            )
-            value_traces.append({
-                'x': ticker_data['Date'],
-                'y': ticker_data['Close'],
-                'type': 'scatter',
-                'name': ticker
-            })
-            volume_traces.append({
-                'x': ticker_data['Date'],
-                'y': ticker_data['Volume'],
-                'type': 'scatter',
-                'name': ticker
-            })
+@app.callback(
+    [
+        Output('prg-render-job', 'value'),
+        Output('prg-render-job', 'label'),
+        Output('itv-render-job', 'disabled', allow_duplicate=True),
+        Output('str-index-values', 'data', allow_duplicate=True),
+        Output('grph-index-volume', 'figure', allow_duplicate=True),
+        Output('grph-commodity-prices', 'figure', allow_duplicate=True)
+    ] + [Output(graph, 'figure', allow_duplicate=True) for graph in analytics_graphs],
+    [
+        Input('itv-render-job', 'n_intervals')
+    ],
+    [
+        State('str-render-job', 'data'),
+        State('str-figure-key', 'data'),
+        State('prg-render-job', 'label')
+    ],
+    prevent_initial_call=True
+)
+def render_progress(n_intervals, job_id, figure_key, previous_label):
+    """Render the tickers a background job has delivered so far."""
+    if job_id is None:
+        raise dash.exceptions.PreventUpdate
 
-        for ticker in commodity_ticker_list:
-            if not ticker:
-                continue
+    state = render_jobs.status(job_id)
+    completed = len(state['done']) + len(state['errors'])
+    progress = 100 * completed / state['total'] if state['total'] else 100
+    label = '{completed}/{total}'.format(completed=completed, total=state['total'])
+    if label == previous_label and not state['finished']:
+        raise dash.exceptions.PreventUpdate
 
-            ticker_data = dl.fetch(
-                ticker=ticker,
-                start=start,
-                end=end,
-                freq=freq
-            )
-            commodity_traces.append({
-                'x': ticker_data['Date'],
-                'y': ticker_data['Close'],
-                'type': 'scatter',
-                'name': ticker
-            })
+    price_panel = load_price_panel(figure_key, state['done'])
+    figures = build_figures(figure_key, price_panel)
 
-        value_plot = {
-            'data': value_traces,
-            'layout': {
-                'title': 'Index Values',
-                'yaxis': ticker_value_yaxis,
-                'showlegend': True,
-                'margin': margin_style
-            }
+    # rolling statistics need all tickers on one date axis, so they are computed once the job is done
+    if state['finished']:
+        figures += build_analytics_figures(figure_key, price_panel)
+    else:
+        figures += (dash.no_update,) * len(analytics_graphs)
+
+    # incomplete results are not cached, so failed tickers are retried on the next run
+    if state['finished'] and not state['errors']:
+        figure_cache.put(
+            figure_cache_key(figure_key),
+            figures,
+            # timestamps and values of all trace points, 8 bytes each
+            size=16 * sum(len(trace['x']) for figure in figures for trace in figure['data'])
+        )
+
+    return (progress, label, state['finished']) + figures
+
+
+@app.callback(
+    [
+        Output('str-index-values', 'data', allow_duplicate=True),
+        Output('grph-index-volume', 'figure', allow_duplicate=True),
+        Output('grph-commodity-prices', 'figure', allow_duplicate=True)
+    ],
+    [
+        Input('grph-index-values', 'relayoutData'),
+        Input('grph-index-volume', 'relayoutData'),
+        Input('grph-commodity-prices', 'relayoutData')
+    ],
+    [
+        State('str-figure-key', 'data')
+    ],
+    prevent_initial_call=True
+)
+def render_zoom(values_relayout, volume_relayout, commodity_relayout, figure_key):
+    """Re-render a zoomed graph at full resolution within the visible range."""
+    if figure_key is None:
+        raise dash.exceptions.PreventUpdate
+
+    graph_id = dash.callback_context.triggered[0]['prop_id'].split('.')[0]
+    relayout_data = {
+        'grph-index-values': values_relayout,
+        'grph-index-volume': volume_relayout,
+        'grph-commodity-prices': commodity_relayout
+    }[graph_id]
+
+    x_range = relayout_x_range(relayout_data)
+    if x_range is None and not (relayout_data or {}).get('xaxis.autorange'):
+        raise dash.exceptions.PreventUpdate
+
+    price_panel, _ = load_ticker_data(figure_key)
+    outputs = [dash.no_update] * 3
+
+    if graph_id == 'grph-index-values':
+        outputs[0] = build_figure('Index Values', figure_key['index_tickers'], 'Close', price_panel, x_range)
+    elif graph_id == 'grph-index-volume':
+        outputs[1] = build_figure('Index Volume', figure_key['index_tickers'], 'Volume', price_panel, x_range)
+    else:
+        outputs[2] = build_figure('Commodity Prices', figure_key['commodity_tickers'], 'Close', price_panel, x_range)
+
+    return outputs
+
+
+# axis scaling is purely presentational and is applied in the browser
+app.clientside_callback(
+    """
+    function(figure, yaxis_scaling) {
+        if (!figure) {
+            return window.dash_clientside.no_update;
         }
-        volume_plot = {
-            'data': volume_traces,
-            'layout': {
-                'title': 'Index Volume',
-                'showlegend': True,
-                'margin': margin_style
-            }
+        var yaxis = {type: yaxis_scaling};
+        if (yaxis_scaling === 'linear') {
+            yaxis.tickformat = ',';
         }
-        commodity_plot = {
-            'data': commodity_traces,
-            'layout': {
-                'title': 'Commodity Prices',
-                'showlegend': True,
-                'margin': margin_style
-            }
+        return Object.assign({}, figure, {layout: Object.assign({}, figure.layout, {yaxis: yaxis})});
+    }
+    """,
+    Output('grph-index-values', 'figure'),
+    [
+        Input('str-index-values', 'data'),
+        Input('rd-axis-scaling', 'value')
+    ]
+)
+
+
+def load_stock_market_index(ticker):
+    if ticker not in stock_market_indices:
+        stock_market_indices[ticker] = StockMarketIndex(
+            isin=index_isins[ticker],
+            yahoo_ticker=ticker,
+            ing_scraper=ing_scraper,
+            yahoo_loader=yahoo_loader,
+            fundamentals_store=fundamentals_store
+        )
+
+    return stock_market_indices[ticker]
+
+
+def fundamentals_job(job_id, tickers):
+    # scraping the profile pages of all components takes minutes, so it never runs inside a request
+    for ticker in tickers:
+        try:
+            load_stock_market_index(ticker).fundamentals()
+        except Exception as error:
+            render_jobs.put_error(job_id, ticker, str(error))
+        else:
+            render_jobs.mark_done(job_id, ticker)
+
+
+@app.callback(
+    [
+        Output('str-fundamentals-job', 'data'),
+        Output('itv-fundamentals-job', 'disabled')
+    ],
+    [
+        Input('btn-run', 'n_clicks')
+    ],
+    [
+        State('txtr-index-tickers', 'value')
+    ]
+)
+def render_fundamentals(n_clicks, index_tickers):
+    if n_clicks is None or not index_tickers:
+        raise dash.exceptions.PreventUpdate
+
+    tickers = [ticker for ticker in dict.fromkeys(index_tickers.split('\n')) if ticker in index_isins]
+    if not tickers:
+        raise dash.exceptions.PreventUpdate
+
+    return render_jobs.submit(len(tickers), fundamentals_job, tickers), False
+
+
+def build_fundamentals_traces(ticker):
+    # the job has stored the fundamentals, so they are read back without loading any profile page
+    index = load_stock_market_index(ticker)
+    fundamentals = index.fundamentals(scrape=False)
+    if not len(fundamentals.years):
+        return []
+
+    index_levels = index.data(
+        start=dt.datetime(int(fundamentals.years.min()), 1, 1),
+        end=dt.datetime.combine(init_end_date, dt.time()),
+        freq='1d'
+    )['Close']
+    summary = fundamentals.summary(index_levels)
+
+    return [
+        {
+            'x': summary.index,
+            'y': summary['pe'],
+            'type': 'scatter',
+            'name': ticker + ' P/E'
+        },
+        {
+            'x': summary.index,
+            'y': summary['pb'],
+            'type': 'scatter',
+            'name': ticker + ' P/B',
+            'yaxis': 'y2'
+        }
+    ]
+
+
+@app.callback(
+    [
+        Output('grph-pe-pb', 'figure'),
+        Output('itv-fundamentals-job', 'disabled', allow_duplicate=True)
+    ],
+    [
+        Input('itv-fundamentals-job', 'n_intervals')
+    ],
+    [
+        State('str-fundamentals-job', 'data')
+    ],
+    prevent_initial_call=True
+)
+def render_fundamentals_progress(n_intervals, job_id):
+    """Render the P/E-P/B graph once the background scrape has finished."""
+    if job_id is None:
+        raise dash.exceptions.PreventUpdate
+
+    state = render_jobs.status(job_id)
+    if not state['finished']:
+        raise dash.exceptions.PreventUpdate
+
+    traces = list()
+    for ticker, error in state['errors'].items():
+        print('no fundamentals for {ticker}: {error}'.format(ticker=ticker, error=error), file=sys.stderr)
+    for ticker in state['done']:
+        try:
+            traces += build_fundamentals_traces(ticker)
+        except Exception as error:
+            print('no fundamentals for {ticker}: {error}'.format(ticker=ticker, error=error), file=sys.stderr)
+
+    return {
+        'data': traces,
+        'layout': {
+            'title': 'Price-Earnings and Price-Book Ratios',
+            'yaxis': {'title': 'P/E'},
+            'yaxis2': {'title': 'P/B', 'overlaying': 'y', 'side': 'right'},
+            'showlegend': True,
+            'margin': margin_style
+        }
+    }, True
+
+
+def load_backtest(ticker, start, end, freq):
+    """Return the backtest engine of an index, reusing the component prices of earlier runs, or None without component tickers."""
+    key = (ticker, start, end, freq)
+    backtest = backtest_cache.get(key)
+
+    if backtest is None and component_tickers:
+        with metrics.timer('stage', stage='backtest_load'):
+            backtest = load_stock_market_index(ticker).backtest(
+                start=dt.datetime.strptime(start, date_format_internal),
+                end=dt.datetime.strptime(end, date_format_internal),
+                freq=freq,
+                ticker_map=component_tickers,
+                periods_per_year=analytics_windows[freq]['periods_per_year']
+            )
+        if backtest is not None:
+            backtest_cache.put(key, backtest, size=8 * backtest.prices.size)
+
+    return backtest
+
+
+@app.callback(
+    Output('grph-index-backtest', 'figure'),
+    [
+        Input('btn-backtest', 'n_clicks')
+    ],
+    [
+        State('dpr-date-period', 'start_date'),
+        State('dpr-date-period', 'end_date'),
+        State('drp-freq', 'value'),
+        State('drp-backtest-index', 'value'),
+        State('chk-backtest-rebalance', 'value'),
+        State('inp-backtest-cap', 'value')
+    ]
+)
+def render_backtest(n_clicks, start_date, end_date, freq, ticker, rebalances, cap):
+    if n_clicks is None or ticker not in index_isins or (start_date is None) or (end_date is None):
+        raise dash.exceptions.PreventUpdate
+
+    start, end = start_date.split('T')[0], end_date.split('T')[0]
+    backtest = load_backtest(ticker, start, end, freq)
+    if backtest is None:
+        # no component of the index has a Yahoo ticker in data/component_tickers.csv
+        raise dash.exceptions.PreventUpdate
+    benchmark = load_stock_market_index(ticker).data(
+        start=dt.datetime.strptime(start, date_format_internal),
+        end=dt.datetime.strptime(end, date_format_internal),
+        freq=freq
+    )['Close']
+
+    labels = {label: rebalance for rebalance, label in IndexBacktest.rebalances.items()}
+    with metrics.timer('stage', stage='backtest'):
+        levels, summary = backtest.grid(
+            rebalances=[labels[label] for label in rebalances or ['none']],
+            cap=(cap or 100) / 100,
+            benchmark=benchmark
+        )
+
+    traces = list()
+    # the benchmark is rebased onto the first level of the reconstructions
+    first = levels.dropna(how='all').index.min()
+    if not pd.isna(first):
+        benchmark = benchmark.loc[first:]
+        benchmark = benchmark / benchmark.iloc[0] * 100
+    series = trace_downsampler(benchmark.dropna())
+    traces.append({'x': series.index, 'y': series, 'type': 'scatter', 'name': ticker})
+
+    for name in levels.columns:
+        series = trace_downsampler(levels[name].dropna())
+        traces.append({
+            'x': series.index,
+            'y': series,
+            'type': 'scatter',
+            'name': '{name} (TE {te:.1%})'.format(name=name, te=summary.loc[name, 'tracking_error'])
+        })
+
+    return {
+        'data': traces,
+        'layout': {
+            'title': 'Index Reconstruction ({n} components)'.format(n=len(backtest.isins)),
+            'showlegend': True,
+            'margin': margin_style
         }
+    }
+
+@app.server.before_request
+def start_panel_refreshers():
+    # started per worker process, only the one holding a panel's leader lock refreshes it
+    for panel in quote_panels.values():
+        panel.start_refresher(yahoo_loader, panel_refresh_interval)
+
+
+@app.server.before_request
+def start_request_trace():
+    flask.g.request_start = time.perf_counter()
+    flask.g.trace_token = metrics.set_trace(flask.request.headers.get('X-Request-ID', uuid.uuid4().hex))
+
+
+@app.server.after_request
+def record_request(response):
+    # covers figure serialisation, which Dash does after the callback returns
+    if 'request_start' in flask.g:
+        metrics.observe('http_request', time.perf_counter() - flask.g.request_start, path=flask.request.path)
+        metrics.inc('http_response_bytes', response.calculate_content_length() or 0, path=flask.request.path)
+
+    return response
+
+
+@app.server.teardown_request
+def end_request_trace(exception):
+    if 'trace_token' in flask.g:
+        metrics.reset_trace(flask.g.trace_token)
+
+
+@app.server.route('/metrics')
+def metrics_endpoint():
+    return flask.Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
-        return value_plot, volume_plot, commodity_plot
 
 if __name__ == '__main__':
     app.run_server(
@@ -0,0 +1,135 @@
+"""
+Class definition for pipeline metrics.
+"""
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+import contextvars
+import json
+import os
+import threading
+import time
+
+
+class Metrics:
+    """Stage timers and counters exposed in the Prometheus text format
+
+    While disabled, timer() hands out a shared no-op context manager and inc()
+    returns immediately, so instrumented code pays for one attribute lookup.
+    When enabled with a trace path, every timed stage is also appended to a
+    JSON-lines log, tagged with the trace id of the request it ran for.
+    """
+    __null_timer = nullcontext()
+    __trace_id = contextvars.ContextVar('trace_id', default=None)
+
+    def __init__(self, enabled=False, prefix='investment_analysis', trace_path=None):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.trace_path = trace_path
+
+        self.__counters = defaultdict(float)
+        self.__timers = defaultdict(lambda: [0, 0.])
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+
+        with self.__lock:
+            self.__counters[self.__key(name, labels)] += value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+
+        with self.__lock:
+            timer = self.__timers[self.__key(name, labels)]
+            timer[0] += 1
+            timer[1] += seconds
+
+        if self.trace_path is not None:
+            self.__trace(name, seconds, labels)
+
+    def timer(self, name, **labels):
+        if not self.enabled:
+            return self.__null_timer
+
+        return self.__timer(name, labels)
+
+    @contextmanager
+    def __timer(self, name, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def set_trace(self, trace_id):
+        """Tag the stages timed from now on in this context with trace_id; returns a reset token."""
+        return self.__trace_id.set(trace_id)
+
+    def reset_trace(self, token):
+        self.__trace_id.reset(token)
+
+    @contextmanager
+    def trace(self, trace_id):
+        token = self.set_trace(trace_id)
+        try:
+            yield
+        finally:
+            self.reset_trace(token)
+
+    def __trace(self, name, seconds, labels):
+        line = json.dumps({
+            'time': time.time(),
+            'trace_id': self.__trace_id.get(),
+            'stage': name,
+            'seconds': seconds,
+            'labels': labels
+        })
+        with self.__lock:
+            with open(self.trace_path, 'a') as f:
+                f.write(line + '\n')
+
+    def reset(self):
+        with self.__lock:
+            self.__counters.clear()
+            self.__timers.clear()
+
+    def render(self):
+        def _labels(items):
+            if not items:
+                return ''
+            return '{' + ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in items) + '}'
+
+        lines = list()
+        with self.__lock:
+            counters = sorted(self.__counters.items())
+            timers = sorted(self.__timers.items())
+
+        for name in sorted({name for (name, _), _ in counters}):
+            metric = '{}_{}_total'.format(self.prefix, name)
+            lines.append('# TYPE {} counter'.format(metric))
+            lines.extend(
+                '{}{} {}'.format(metric, _labels(labels), value)
+                for (counter, labels), value in counters if counter == name
+            )
+
+        for name in sorted({name for (name, _), _ in timers}):
+            metric = '{}_{}_seconds'.format(self.prefix, name)
+            lines.append('# TYPE {} summary'.format(metric))
+            for (timer, labels), (count, total) in timers:
+                if timer == name:
+                    lines.append('{}_count{} {}'.format(metric, _labels(labels), count))
+                    lines.append('{}_sum{} {}'.format(metric, _labels(labels), total))
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics(
+    enabled=os.environ.get('INVESTMENT_ANALYSIS_METRICS') == '1',
+    trace_path=os.environ.get('INVESTMENT_ANALYSIS_TRACE_LOG')
+)
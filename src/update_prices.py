@@ -0,0 +1,83 @@
+"""
+Incremental end-of-day update of index benchmarks and their components.
+
+Both the indices and the component ticker map are CSV files with the columns
+`isin` and `ticker`, e.g.
+
+    isin,ticker
+    DE0008469008,%5EGDAXI
+
+Only the bars since the last stored date are downloaded. Component changes
+are logged to `<state>/component_changes.jsonl`. Without --once the update
+runs every weekday at --at until interrupted.
+"""
+import argparse
+import datetime as dt
+import sys
+
+from src.data.EndOfDayUpdater import EndOfDayUpdater
+from src.data.IngDataScraper import IngDataScraper
+from src.data.PageCache import PageCache
+from src.data.QuoteStore import QuoteStore
+from src.data.SqliteCacheBackend import SqliteCacheBackend
+from src.data.YahooDataLoader import YahooDataLoader
+from src.finance.components.StockMarketIndex import StockMarketIndex
+
+
+def parse_time(value):
+    return dt.datetime.strptime(value, '%H:%M').time()
+
+
+def print_report(report):
+    statuses = dict()
+    for ticker, (status, bars) in sorted(report['tickers'].items()):
+        statuses[status] = statuses.get(status, 0) + 1
+        if status != 'current':
+            print('{ticker}: {status}, {bars} bars'.format(ticker=ticker, status=status, bars=bars))
+    for isin, (added, removed) in report['components'].items():
+        if added or removed:
+            print('{isin}: added {added}, removed {removed}'.format(isin=isin, added=added, removed=removed))
+    for key, error in report['errors'].items():
+        print('failed {key}: {error}'.format(key=key, error=error), file=sys.stderr)
+    if report['unmapped']:
+        print('{n} components without a ticker'.format(n=len(report['unmapped'])), file=sys.stderr)
+    print(', '.join('{n} {status}'.format(n=n, status=status) for status, n in sorted(statuses.items())))
+
+
+parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+parser.add_argument('indices', help='CSV file with the isin and yahoo ticker of every tracked index')
+parser.add_argument('--ticker-map', help='CSV file with the isin and yahoo ticker of index components')
+parser.add_argument('--tickers', nargs='*', default=[], help='further yahoo tickers to update')
+parser.add_argument('--store', default='data/quotes', help='directory of the quote store')
+parser.add_argument('--cache', default='data/cache.sqlite', help='response cache shared with the dashboard')
+parser.add_argument('--state', default='data/eod', help='directory for component lists and the change log')
+parser.add_argument('--at', type=parse_time, default=dt.time(23, 0), help='time of the daily update, HH:MM')
+parser.add_argument('--once', action='store_true', help='run a single update and exit')
+args = parser.parse_args()
+
+indices = EndOfDayUpdater.read_ticker_map(args.indices)
+ticker_map = EndOfDayUpdater.read_ticker_map(args.ticker_map) if args.ticker_map else dict()
+
+with SqliteCacheBackend(args.cache) as cache_backend, \
+        YahooDataLoader(store=QuoteStore(args.store), cache=cache_backend) as yahoo_loader, \
+        IngDataScraper(cache=PageCache(backend=cache_backend)) as ing_scraper:
+    updater = EndOfDayUpdater(
+        indices=[
+            StockMarketIndex(isin, ticker, ing_scraper=ing_scraper, yahoo_loader=yahoo_loader)
+            for isin, ticker in indices.items()
+        ],
+        yahoo_loader=yahoo_loader,
+        ticker_map=ticker_map,
+        tickers=args.tickers,
+        state_path=args.state
+    )
+
+    if args.once:
+        report = updater.run()
+        print_report(report)
+        sys.exit(1 if report['errors'] else 0)
+
+    try:
+        updater.run_forever(at=args.at, on_report=print_report)
+    except KeyboardInterrupt:
+        pass